@@ -1,41 +1,181 @@
 # backend/app/crud.py
 from __future__ import annotations
 
-import anyio  
 import asyncio
-from typing import List
-
-from passlib.context import CryptContext
-from sqlalchemy import func
+import hashlib
+import json
+import logging
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
-from backend.app import models, schemas, telegram
+from backend.app import models, resources, schemas, telegram
+from backend.app.services import matcher
 from backend.app.services.insales import fetch_orders
 
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+log = logging.getLogger("crud")
 
 # ---------------------------------------------------------------------
 # helpers
 # ---------------------------------------------------------------------
-def set_user_password(db: Session, user: models.User, raw_password: str) -> None:
-    user.hashed_password = pwd_ctx.hash(raw_password)
-    db.commit()
+def _naive_utc(dt: datetime) -> datetime:
+    """В БД время хранится как naive UTC — приводим aware-даты InSales к нему."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def get_checkpoint(db: Session, name: str) -> Optional[str]:
+    cp = db.get(models.Checkpoint, name)
+    return cp.value if cp else None
+
+
+def set_checkpoint(db: Session, name: str, value: str) -> None:
+    """Пишем отметку в текущей транзакции (коммит — на вызывающем)."""
+    stmt = pg_insert(models.Checkpoint).values(
+        name=name, value=value, updated_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Checkpoint.name],
+        set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+    )
+    db.execute(stmt)
 
 
 def _current_qty(db: Session, material_id: int) -> float:
-    base = (
-        db.query(models.Material.base_qty)
-        .filter_by(id=material_id)
-        .scalar()
-        or 0.0
+    row = (
+        db.query(
+            models.Material.base_qty,
+            func.coalesce(models.MaterialBalance.qty, 0.0),
+        )
+        .outerjoin(
+            models.MaterialBalance,
+            models.MaterialBalance.material_id == models.Material.id,
+        )
+        .filter(models.Material.id == material_id)
+        .first()
     )
-    delta = (
-        db.query(func.coalesce(func.sum(models.StockMovement.qty), 0.0))
-        .filter_by(material_id=material_id)
-        .scalar()
-        or 0.0
+    if not row:
+        return 0.0
+    base, delta = row
+    return (base or 0.0) + (delta or 0.0)
+
+
+# ---------------------------------------------------------------------
+# balances: material_balances = SUM(stock_movements.qty) по материалу
+# ---------------------------------------------------------------------
+BALANCE_EPS = 1e-6
+
+
+def _bump_balances(db: Session, deltas: Dict[int, float]) -> None:
+    """
+    Сдвигаем балансы на deltas {material_id: qty} в текущей транзакции.
+    UPSERT атомарен, поэтому параллельные списания не теряются.
+    """
+    if any(deltas.values()):
+        resources.bump(db, resources.MATERIALS)
+    for material_id, delta in deltas.items():
+        if not delta:
+            continue
+        stmt = pg_insert(models.MaterialBalance).values(
+            material_id=material_id, qty=delta
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.MaterialBalance.material_id],
+            set_={"qty": models.MaterialBalance.qty + stmt.excluded.qty},
+        )
+        db.execute(stmt)
+
+
+def _add_movements(db: Session, rows: List[dict]) -> None:
+    """Добавляем движения и сразу учитываем их в балансах."""
+    deltas: Dict[int, float] = defaultdict(float)
+    for row in rows:
+        db.add(models.StockMovement(**row))
+        deltas[row["material_id"]] += row["qty"]
+    _bump_balances(db, deltas)
+
+
+def _delete_movements(db: Session, *criteria) -> int:
+    """
+    Удаляем движения по фильтру и вычитаем их из балансов.
+    DELETE … RETURNING — ровно то, что удалили, без гонки с вставками.
+    """
+    deleted = db.execute(
+        delete(models.StockMovement)
+        .where(*criteria)
+        .returning(models.StockMovement.material_id, models.StockMovement.qty)
+        .execution_options(synchronize_session=False)
+    ).all()
+    deltas: Dict[int, float] = defaultdict(float)
+    for material_id, qty in deleted:
+        deltas[material_id] -= qty
+    _bump_balances(db, deltas)
+    return len(deleted)
+
+
+def check_balances(db: Session, fix: bool = False) -> List[dict]:
+    """
+    Сверяем material_balances с журналом: снимок material_snapshots
+    + SUM(stock_movements). Возвращаем список расхождений;
+    при fix=True перестраиваем балансы.
+    """
+    if fix:
+        # блокируем изменения балансов, пока считаем журнал заново
+        db.execute(text("LOCK TABLE material_balances IN SHARE ROW EXCLUSIVE MODE"))
+
+    ledger = (
+        db.query(
+            models.StockMovement.material_id.label("material_id"),
+            func.sum(models.StockMovement.qty).label("qty"),
+        )
+        .group_by(models.StockMovement.material_id)
+        .subquery()
+    )
+    rows = (
+        db.query(
+            models.Material.id,
+            models.Material.name,
+            func.coalesce(models.MaterialBalance.qty, 0.0),
+            func.coalesce(models.MaterialSnapshot.qty, 0.0)
+            + func.coalesce(ledger.c.qty, 0.0),
+        )
+        .outerjoin(
+            models.MaterialBalance,
+            models.MaterialBalance.material_id == models.Material.id,
+        )
+        .outerjoin(
+            models.MaterialSnapshot,
+            models.MaterialSnapshot.material_id == models.Material.id,
+        )
+        .outerjoin(ledger, ledger.c.material_id == models.Material.id)
+        .all()
     )
-    return base + delta
+
+    drift = [
+        {"id": mid, "name": name, "balance": bal, "ledger": led, "diff": bal - led}
+        for mid, name, bal, led in rows
+        if abs(bal - led) > BALANCE_EPS
+    ]
+
+    if fix and drift:
+        for d in drift:
+            stmt = pg_insert(models.MaterialBalance).values(
+                material_id=d["id"], qty=d["ledger"]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.MaterialBalance.material_id],
+                set_={"qty": stmt.excluded.qty},
+            )
+            db.execute(stmt)
+        resources.bump(db, resources.MATERIALS)
+    db.commit()
+    return drift
 
 
 # ---------------------------------------------------------------------
@@ -52,6 +192,7 @@ def create_or_add_material(db: Session, data: schemas.MaterialCreate) -> models.
     else:
         mat = models.Material(**data.dict())
         db.add(mat)
+    resources.bump(db, resources.MATERIALS)
     db.commit()
     db.refresh(mat)
     return mat
@@ -63,10 +204,15 @@ def delete_material(db: Session, material_id: int) -> None:
     чтобы не получить ошибку внешнего ключа.
     """
     db.query(models.StockMovement).filter_by(material_id=material_id).delete()
+    db.query(models.MaterialBalance).filter_by(material_id=material_id).delete()
+    db.query(models.MaterialSnapshot).filter_by(material_id=material_id).delete()
     db.query(models.MaterialRule).filter_by(material_id=material_id).delete()
     db.query(models.Supplier).filter_by(material_id=material_id).delete()
     db.query(models.Material).filter_by(id=material_id).delete()
+    _rules_changed(db)
+    resources.bump(db, resources.MATERIALS)
     db.commit()
+    matcher.invalidate()
 
 
 def history_material(db: Session, mid: int, limit: int = 50):
@@ -87,13 +233,11 @@ def history_material(db: Session, mid: int, limit: int = 50):
 
 
 def add_adjustment(db: Session, material_id: int, delta: float) -> None:
-    db.add(
-        models.StockMovement(
-            material_id=material_id,
-            order_id=None,
-            qty=delta,
-        )
-    )
+    _add_movements(db, [{
+        "material_id": material_id,
+        "order_id":    None,
+        "qty":         delta,
+    }])
     db.commit()
 
 
@@ -106,14 +250,13 @@ def stock_materials(db: Session) -> list[dict]:
             models.Material.min_qty,
             (
                 models.Material.base_qty
-                + func.coalesce(func.sum(models.StockMovement.qty), 0.0)
+                + func.coalesce(models.MaterialBalance.qty, 0.0)
             ).label("qty"),
         )
         .outerjoin(
-            models.StockMovement,
-            models.Material.id == models.StockMovement.material_id,
+            models.MaterialBalance,
+            models.Material.id == models.MaterialBalance.material_id,
         )
-        .group_by(models.Material.id)
         .all()
     )
     return [
@@ -128,6 +271,82 @@ def stock_materials(db: Session) -> list[dict]:
     ]
 
 
+def low_stock_transitions(db: Session) -> List[dict]:
+    """
+    Одним запросом находим материалы, у которых должен смениться флаг alerted:
+    • alert=True  — остаток опустился до минимума, оповещения ещё не было;
+    • alert=False — остаток снова выше минимума, флаг надо снять.
+    """
+    qty = models.Material.base_qty + func.coalesce(models.MaterialBalance.qty, 0.0)
+    rows = (
+        db.query(
+            models.Material.id,
+            models.Material.name,
+            models.Material.min_qty,
+            models.Material.alerted,
+            qty.label("qty"),
+        )
+        .outerjoin(
+            models.MaterialBalance,
+            models.MaterialBalance.material_id == models.Material.id,
+        )
+        .filter(or_(
+            and_(qty <= models.Material.min_qty, models.Material.alerted.is_(False)),
+            and_(qty > models.Material.min_qty, models.Material.alerted.is_(True)),
+        ))
+        .all()
+    )
+    return [
+        {
+            "id": r.id,
+            "name": r.name,
+            "qty": r.qty,
+            "min_qty": r.min_qty,
+            "alert": not r.alerted,
+        }
+        for r in rows
+    ]
+
+
+def claim_order_flag(db: Session, order_id: int, flag: str) -> bool:
+    """
+    Ставим флаг уведомления заказа (client_notified / ready_notified) условным UPDATE.
+    True — флаг поставили мы, и сообщение ставит в outbox только этот вызов:
+    параллельная транзакция ждёт нашего commit и строку уже не получит.
+    """
+    col = getattr(models.Order, flag)
+    return db.execute(
+        update(models.Order)
+        .where(models.Order.id == order_id, col.is_(False))
+        .values({col: True})
+        .returning(models.Order.id)
+    ).first() is not None
+
+
+def set_alerted(db: Session, alerts: List[dict], clear_ids: List[int]) -> None:
+    """
+    Массово ставим/снимаем alerted одним коммитом. Для материалов, где флаг
+    действительно встал (alerts — строки из low_stock_transitions), тем же коммитом
+    кладём оповещение в outbox.
+    """
+    if alerts:
+        by_id = {f["id"]: f for f in alerts}
+        flipped = db.execute(
+            update(models.Material)
+            .where(models.Material.id.in_(by_id), models.Material.alerted.is_(False))
+            .values(alerted=True)
+            .returning(models.Material.id)
+        ).scalars().all()
+        for mid in flipped:
+            f = by_id[mid]
+            enqueue_message(db, telegram.low_stock_text(f["name"], f["qty"], f["min_qty"]))
+    if clear_ids:
+        db.query(models.Material)\
+          .filter(models.Material.id.in_(clear_ids), models.Material.alerted.is_(True))\
+          .update({models.Material.alerted: False}, synchronize_session=False)
+    db.commit()
+
+
 # ---------------------------------------------------------------------
 # rules
 # ---------------------------------------------------------------------
@@ -135,54 +354,153 @@ def list_rules(db: Session) -> List[models.MaterialRule]:
     return db.query(models.MaterialRule).all()
 
 
+def _rules_changed(db: Session) -> None:
+    """Новая версия правил: сбрасывает кеш сопоставителя здесь и в других процессах."""
+    set_checkpoint(db, matcher.RULES_VERSION, uuid.uuid4().hex)
+
+
 def create_rule(db: Session, data: schemas.MaterialRuleCreate) -> models.MaterialRule:
     rule = models.MaterialRule(**data.dict())
     db.add(rule)
+    _rules_changed(db)
     db.commit()
+    matcher.invalidate()
     db.refresh(rule)
     return rule
 
 
 def delete_rule(db: Session, rule_id: int) -> None:
     db.query(models.MaterialRule).filter_by(id=rule_id).delete()
+    _rules_changed(db)
     db.commit()
+    matcher.invalidate()
 
 
 # ---------------------------------------------------------------------
 # internal: apply rules to an order (create StockMovement records)
 # ---------------------------------------------------------------------
-def _apply_rules(db: Session, order: schemas.OrderOut) -> None:
+def _apply_rules(db: Session, order: schemas.OrderOut, compacted: bool = False) -> None:
     """
-    Сначала удаляем старые движения этого заказа, затем создаём новые
-    в соответствии с материал-правилами.
+    Приводим движения заказа к тому, что дают материал-правила:
+    совпадающие оставляем как есть, лишние удаляем, недостающие добавляем.
+    Заказы, чьи движения компакция уже свернула в снимки (orders.compacted),
+    не трогаем: повторное списание задвоило бы остаток. Важно именно это,
+    а не дата заказа — у старого заказа движения могли появиться недавно.
+    Коммит — на вызывающем.
     """
-    db.query(models.StockMovement).filter_by(order_id=order.id).delete()
-
-    if order.ignored:
-        db.commit()
+    if compacted:
         return
 
-    rules = db.query(models.MaterialRule).all()
-    for ln in order.lines:
-        title_lc = ln.product_title.lower()
-        for r in rules:
-            if r.pattern.lower() in title_lc:
-                db.add(
-                    models.StockMovement(
-                        material_id=r.material_id,
-                        order_id=order.id,
-                        qty=-(r.qty * ln.quantity),
-                    )
+    want: Counter = Counter()
+    if not order.ignored:
+        rules = matcher.get_matcher(db)
+        for ln in order.lines:
+            for material_id, qty in rules.match(ln.product_title):
+                want[(material_id, -(qty * ln.quantity))] += 1
+
+    stale = []
+    for mv_id, material_id, qty in (
+        db.query(models.StockMovement.id,
+                 models.StockMovement.material_id,
+                 models.StockMovement.qty)
+        .filter(models.StockMovement.order_id == order.id)
+    ):
+        if want[(material_id, qty)] > 0:
+            want[(material_id, qty)] -= 1
+        else:
+            stale.append(mv_id)
+
+    if stale:
+        _delete_movements(db, models.StockMovement.id.in_(stale))
+    _add_movements(db, [
+        {"material_id": material_id, "order_id": order.id, "qty": qty}
+        for (material_id, qty), n in want.items()
+        for _ in range(n)
+    ])
+
+
+def _sync_lines(db: Session, data: schemas.OrderOut) -> None:
+    """Строки заказа: удаляем исчезнувшие, добавляем новые, совпадающие не трогаем."""
+    want = Counter(
+        (ln.product_id, ln.product_title, ln.quantity) for ln in data.lines
+    )
+    for line in db.query(models.OrderLine).filter_by(order_id=data.id):
+        key = (line.product_id, line.product_title, line.quantity)
+        if want[key] > 0:
+            want[key] -= 1
+        else:
+            db.delete(line)
+    for (product_id, product_title, quantity), n in want.items():
+        for _ in range(n):
+            db.add(
+                models.OrderLine(
+                    order_id=data.id,
+                    product_id=product_id,
+                    product_title=product_title,
+                    quantity=quantity,
                 )
-    db.commit()
+            )
 
 
 # ---------------------------------------------------------------------
 # orders
 # ---------------------------------------------------------------------
+# счётчики upsert_order: created / rewritten / skipped (нарастающим итогом)
+UPSERT_STATS: Counter = Counter()
+
+
+def order_fingerprint(data: schemas.OrderOut, rules_version: Optional[str]) -> str:
+    """
+    Отпечаток всего, что upsert_order пишет в БД: статус, ignored, строки
+    и версия правил (после правки правил заказ надо пересчитать).
+    """
+    payload = {
+        "number":   data.number,
+        "customer": data.customer,
+        "created":  data.created_at.isoformat(),
+        "ignored":  data.ignored,
+        "status":   data.custom_status.permalink if data.custom_status else None,
+        "lines":    sorted(
+            [ln.product_id, ln.product_title, ln.quantity] for ln in data.lines
+        ),
+        "rules":    rules_version,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _older(order: Optional[models.Order], data: schemas.OrderOut) -> bool:
+    """data — версия заказа старше уже записанной (по updated_at из InSales)."""
+    return bool(order and order.updated_at and data.updated_at
+                and _naive_utc(data.updated_at) < order.updated_at)
+
+
+def is_stale(db: Session, data: schemas.OrderOut) -> bool:
+    return _older(db.get(models.Order, data.id), data)
+
+
 def upsert_order(db: Session, data: schemas.OrderOut) -> models.Order:
+    """
+    Заказ без изменений (совпал отпечаток) пропускаем целиком.
+    Версию старше записанной (запоздавший или повторный вебхук) — тоже.
+    Изменившийся обновляем одной транзакцией с минимальным диффом строк и движений.
+    """
+    fingerprint = order_fingerprint(data, matcher.rules_version(db))
     order = db.get(models.Order, data.id)
-    if not order:
+    if order and order.fingerprint == fingerprint:
+        UPSERT_STATS["skipped"] += 1
+        return order
+    if order:
+        # лок строки заказа до commit: reapply_rules берёт его же на свою порцию,
+        # дифф движений ниже не пересечётся с её DELETE … INSERT
+        db.refresh(order, with_for_update=True)
+        if _older(order, data):
+            db.commit()                 # снимаем лок, ничего не меняли
+            UPSERT_STATS["stale"] += 1
+            return order
+
+    created = order is None
+    if created:
         order = models.Order(
             id=data.id,
             number=data.number,
@@ -193,25 +511,16 @@ def upsert_order(db: Session, data: schemas.OrderOut) -> models.Order:
     order.customer = f"{data.surname} {data.name}".strip() if hasattr(data, "surname") else data.customer
     order.created_at = data.created_at
     order.ignored = data.ignored
-    db.commit()
-
-    # replace order lines
-    db.query(models.OrderLine).filter_by(order_id=data.id).delete()
-    for line in data.lines:
-        db.add(
-            models.OrderLine(
-                order_id=data.id,
-                product_id=line.product_id,
-                product_title=line.product_title,
-                quantity=line.quantity,
-            )
-        )
-    db.commit()
+    order.fingerprint = fingerprint
+    if data.updated_at:
+        order.updated_at = _naive_utc(data.updated_at)
 
+    _sync_lines(db, data)
     # применяем правила списания
-    _apply_rules(db, data)
+    _apply_rules(db, data, order.compacted)
+    db.commit()
 
-    db.refresh(order)
+    UPSERT_STATS["created" if created else "rewritten"] += 1
     return order
 
 
@@ -223,21 +532,332 @@ def ignore_order(db: Session, order_id: int, ignore: bool) -> None:
     """
     Помечаем/снимаем заказ как ignored и создаём компенсирующие движения.
     """
-    order = db.get(models.Order, order_id)
+    order = db.get(models.Order, order_id, with_for_update=True)   # лок как в upsert_order
     if not order or order.ignored == ignore:
         return
 
     # инвертируем уже созданные записи StockMovement
-    for mv in db.query(models.StockMovement).filter_by(order_id=order_id).all():
-        db.add(
-            models.StockMovement(
-                material_id=mv.material_id,
-                order_id=None,
-                qty=-mv.qty,
+    _add_movements(db, [
+        {"material_id": mv.material_id, "order_id": None, "qty": -mv.qty}
+        for mv in db.query(models.StockMovement).filter_by(order_id=order_id).all()
+    ])
+    order.ignored = ignore
+    db.commit()
+
+
+# ---------------------------------------------------------------------
+# rules backfill: пересчёт движений всех заказов по текущим правилам
+# ---------------------------------------------------------------------
+BACKFILL_CHECKPOINT = "rules_backfill"
+BACKFILL_CHUNK      = 500          # заказов на транзакцию
+_BACKFILL_LOCK_KEY  = 0x72756C65   # "rule" — один пересчёт на всю базу
+
+
+def backfill_status(db: Session) -> Optional[dict]:
+    raw = get_checkpoint(db, BACKFILL_CHECKPOINT)
+    return json.loads(raw) if raw else None
+
+
+def reapply_rules(
+    db: Session,
+    chunk: int = BACKFILL_CHUNK,
+    resume: bool = True,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Пересчитываем движения всех неигнорируемых заказов по текущим правилам.
+
+    id заказов читаются серверным курсором на отдельном соединении,
+    порциями по `chunk` заказов: заказы порции блокируются (FOR UPDATE, как
+    в upsert_order), их строки перечитываются, движения удаляются (DELETE … RETURNING),
+    новые пишутся одной пакетной вставкой, балансы сдвигаются на разницу,
+    курсор (последний order_id) фиксируется в checkpoints — всё одной транзакцией.
+    Прерванный пересчёт продолжается с курсора, если правила с тех пор не менялись.
+    Время движений сохраняется (статистика не «переезжает» в сегодня);
+    у новых совпадений — текущее. Заказы, чьи движения свёрнуты компакцией
+    (orders.compacted), не трогаем.
+    Возвращаем число пересчитанных заказов.
+    """
+    rules   = matcher.get_matcher(db)
+    version = matcher.rules_version(db)
+    state   = backfill_status(db) if resume else None
+    if not state or state.get("finished") or state.get("rules") != version:
+        state = {"rules": version, "after": 0, "done": 0, "total": 0, "finished": False}
+
+    SM, OL, O = models.StockMovement, models.OrderLine, models.Order
+    scope = [O.ignored.is_(False), O.compacted.is_(False), O.id > state["after"]]
+    state["total"] = state["done"] + (
+        db.query(func.count(func.distinct(OL.order_id)))
+        .join(O, O.id == OL.order_id)
+        .filter(*scope)
+        .scalar() or 0
+    )
+
+    def flush(batch: List[int]) -> None:
+        # блокируем заказы порции (в порядке id) — тот же лок берёт upsert_order,
+        # так что синхронизация и вебхуки не меняют их движения между DELETE и INSERT;
+        # строки перечитываем уже под локом, заказ мог измениться с чтения курсора
+        ids = db.execute(
+            select(O.id)
+            .where(O.id.in_(batch), O.ignored.is_(False), O.compacted.is_(False))
+            .order_by(O.id)
+            .with_for_update()
+        ).scalars().all()
+        lines_by_order: Dict[int, list] = defaultdict(list)
+        for order_id, title, quantity in db.execute(
+            select(OL.order_id, OL.product_title, OL.quantity).where(OL.order_id.in_(ids))
+        ):
+            lines_by_order[order_id].append((title, quantity))
+
+        deleted = db.execute(
+            delete(SM)
+            .where(SM.order_id.in_(ids))
+            .returning(SM.order_id, SM.material_id, SM.qty, SM.created_at)
+            .execution_options(synchronize_session=False)
+        ).all()
+        deltas: Dict[int, float] = defaultdict(float)
+        stamp: Dict[int, datetime] = {}
+        for order_id, material_id, qty, created_at in deleted:
+            deltas[material_id] -= qty
+            stamp[order_id] = min(stamp.get(order_id, created_at), created_at)
+
+        now, rows = datetime.utcnow(), []
+        for order_id, lines in lines_by_order.items():
+            for title, quantity in lines:
+                for material_id, qty in rules.match(title):
+                    rows.append({
+                        "material_id": material_id,
+                        "order_id":    order_id,
+                        "qty":         -(qty * quantity),
+                        "created_at":  stamp.get(order_id, now),
+                    })
+                    deltas[material_id] -= qty * quantity
+        if rows:
+            db.execute(insert(SM), rows)
+        _bump_balances(db, deltas)
+
+        state["after"] = max(batch)
+        state["done"] += len(batch)
+        set_checkpoint(db, BACKFILL_CHECKPOINT, json.dumps(state))
+        db.commit()
+        if progress:
+            progress(state["done"], state["total"])
+
+    stream = db.get_bind().connect()
+    try:
+        if not stream.execute(select(func.pg_try_advisory_lock(_BACKFILL_LOCK_KEY))).scalar():
+            raise RuntimeError("пересчёт правил уже идёт")
+        try:
+            result = stream.execution_options(stream_results=True, yield_per=chunk * 10).execute(
+                select(O.id)
+                .where(*scope, select(OL.id).where(OL.order_id == O.id).exists())
+                .order_by(O.id)
             )
+            batch: List[int] = []
+            for (order_id,) in result:
+                batch.append(order_id)
+                if len(batch) >= chunk:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+        finally:
+            stream.execute(select(func.pg_advisory_unlock(_BACKFILL_LOCK_KEY)))
+    finally:
+        stream.close()
+
+    state["finished"] = True
+    set_checkpoint(db, BACKFILL_CHECKPOINT, json.dumps(state))
+    db.commit()
+    return state["done"]
+
+
+# ---------------------------------------------------------------------
+# ledger retention: сворачиваем старые движения в снимки
+# ---------------------------------------------------------------------
+COMPACTION_CHECKPOINT = "ledger_compacted_until"
+COMPACTION_BATCH      = 5000
+
+
+def compact_movements(db: Session, cutoff: datetime, batch: int = COMPACTION_BATCH) -> int:
+    """
+    Сворачиваем движения старше cutoff в material_snapshots порциями по `batch`.
+    Каждая порция — отдельная короткая транзакция: DELETE … RETURNING,
+    прибавка удалённого к снимку и отметка orders.compacted у заказов,
+    чьи движения свёрнуты. Балансы (снимок + журнал) не меняются.
+    В конце записываем водяной знак компакции. Возвращаем число свёрнутых строк.
+    """
+    total = 0
+    while True:
+        ids = (
+            select(models.StockMovement.id)
+            .where(models.StockMovement.created_at < cutoff)
+            .order_by(models.StockMovement.id)
+            .limit(batch)
+            .scalar_subquery()
         )
-    order.ignored = ignore
+        deleted = db.execute(
+            delete(models.StockMovement)
+            .where(models.StockMovement.id.in_(ids))
+            .returning(models.StockMovement.material_id, models.StockMovement.qty,
+                       models.StockMovement.order_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        folded: Dict[int, float] = defaultdict(float)
+        orders = set()
+        for material_id, qty, order_id in deleted:
+            folded[material_id] += qty
+            if order_id is not None:
+                orders.add(order_id)
+        _fold_into_snapshots(db, folded, cutoff)
+        _mark_compacted(db, orders)
+        db.commit()
+
+        total += len(deleted)
+        if len(deleted) < batch:
+            break
+
+    set_checkpoint(db, COMPACTION_CHECKPOINT, cutoff.isoformat())
     db.commit()
+    return total
+
+
+def _mark_compacted(db: Session, order_ids) -> None:
+    """Заказы, часть движений которых ушла в снимки: правила к ним больше не применяем."""
+    if order_ids:
+        db.execute(
+            update(models.Order)
+            .where(models.Order.id.in_(list(order_ids)), models.Order.compacted.is_(False))
+            .values(compacted=True)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _fold_into_snapshots(db: Session, folded: Dict[int, float], as_of: datetime) -> None:
+    for material_id, qty in folded.items():
+        stmt = pg_insert(models.MaterialSnapshot).values(
+            material_id=material_id, qty=qty, as_of=as_of
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.MaterialSnapshot.material_id],
+            set_={
+                "qty":   models.MaterialSnapshot.qty + stmt.excluded.qty,
+                "as_of": func.greatest(models.MaterialSnapshot.as_of, stmt.excluded.as_of),
+            },
+        )
+        db.execute(stmt)
+
+
+# ---------------------------------------------------------------------
+# ready films: склад готовых плёнок
+# ---------------------------------------------------------------------
+def sync_ready_films(db: Session, lines: List[dict]) -> int:
+    """
+    Приводим ready_films к строкам складского заказа по ключу sku:
+    новые добавляем, исчезнувшие удаляем, изменившиеся обновляем
+    (updated_at меняется только у них). Одинаковые sku суммируем.
+    Возвращаем число изменённых строк (0 — ничего не писали).
+    """
+    want: Dict[str, tuple] = {}
+    for ln in lines:
+        sku = ln.get("sku") or str(ln.get("id") or ln.get("product_id"))
+        qty = ln.get("quantity", 0) or 0
+        if sku in want:
+            want[sku] = (want[sku][0], want[sku][1] + qty)
+        else:
+            want[sku] = (ln.get("title"), qty)
+
+    changes = 0
+    existing = {f.sku: f for f in db.query(models.ReadyFilm)}
+    for sku, film in existing.items():
+        if sku not in want:
+            db.delete(film)
+            changes += 1
+    for sku, (title, qty) in want.items():
+        film = existing.get(sku)
+        if film is None:
+            db.add(models.ReadyFilm(sku=sku, title=title, quantity=qty))
+            changes += 1
+        elif film.title != title or film.quantity != qty:
+            film.title, film.quantity = title, qty
+            changes += 1
+
+    if changes:
+        resources.bump(db, resources.FILMS)
+        db.commit()
+    return changes
+
+
+# ---------------------------------------------------------------------
+# InSales webhooks: очередь событий
+# ---------------------------------------------------------------------
+WEBHOOK_MAX_ATTEMPTS = 5
+
+
+def enqueue_webhook(db: Session, topic: str, order_id: int, payload: str) -> None:
+    db.add(models.WebhookEvent(topic=topic, order_id=order_id, payload=payload))
+    db.commit()
+
+
+def pending_webhooks(db: Session, limit: int = 100) -> List[models.WebhookEvent]:
+    """Необработанные события в порядке поступления (без исчерпавших попытки)."""
+    return (
+        db.query(models.WebhookEvent)
+        .filter(models.WebhookEvent.processed_at.is_(None),
+                models.WebhookEvent.attempts < WEBHOOK_MAX_ATTEMPTS)
+        .order_by(models.WebhookEvent.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def finish_webhooks(db: Session, ids: List[int], error: Optional[str] = None) -> None:
+    """Отмечаем события обработанными, а при ошибке — увеличиваем попытки."""
+    q = db.query(models.WebhookEvent).filter(models.WebhookEvent.id.in_(ids))
+    if error is None:
+        q.update({models.WebhookEvent.processed_at: datetime.utcnow()},
+                 synchronize_session=False)
+    else:
+        q.update({models.WebhookEvent.attempts: models.WebhookEvent.attempts + 1,
+                  models.WebhookEvent.error: error[:500]},
+                 synchronize_session=False)
+    db.commit()
+
+
+def purge_webhooks(db: Session, before: datetime) -> int:
+    n = (
+        db.query(models.WebhookEvent)
+        .filter(models.WebhookEvent.processed_at < before)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return n
+
+
+# ---------------------------------------------------------------------
+# Telegram outbox: сообщения пишутся в транзакции вызывающего
+# ---------------------------------------------------------------------
+def enqueue_message(db: Session, text: str) -> None:
+    """
+    Кладём сообщение в outbox; commit — за вызывающим, вместе с флагом уведомления.
+    Отправляет backend.app.outbox (при ненастроенном боте/чате сообщение не копим).
+    """
+    chat_id = telegram.route(text)
+    if not telegram.TOKEN or not chat_id:
+        log.warning("Telegram не настроен, уведомление пропущено: %s", text[:80])
+        return
+    db.add(models.OutboxMessage(chat_id=chat_id, text=text))
+
+
+def purge_outbox(db: Session, before: datetime) -> int:
+    n = (
+        db.query(models.OutboxMessage)
+        .filter(models.OutboxMessage.sent_at < before)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return n
 
 
 # ---------------------------------------------------------------------
@@ -258,7 +878,7 @@ def import_orders(db: Session, limit: int = 50) -> int:
 def update_min_qty(db: Session, material_id: int, new_min: float) -> None:
     """
     Обновляем минимальный остаток для материала и,
-    при необходимости, отправляем или снимаем телеграм-алёрт.
+    при необходимости, ставим оповещение в outbox или снимаем флаг алёрта.
     """
     mat = db.get(models.Material, material_id)
     if not mat:                       # материал не найден
@@ -269,13 +889,12 @@ def update_min_qty(db: Session, material_id: int, new_min: float) -> None:
 
     # если опустились ниже минимума и ещё не слали оповещение
     if current <= mat.min_qty and not mat.alerted:
-        anyio.from_thread.run(
-            telegram.low_stock, mat.name, current, mat.min_qty
-        )
+        enqueue_message(db, telegram.low_stock_text(mat.name, current, mat.min_qty))
         mat.alerted = True
 
     # если снова стало больше минимума — сбрасываем флаг
     elif current > mat.min_qty and mat.alerted:
         mat.alerted = False
 
-    db.commit()
\ No newline at end of file
+    resources.bump(db, resources.MATERIALS)
+    db.commit()
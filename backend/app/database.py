@@ -1,8 +1,14 @@
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
 
 DATABASE_URL=os.getenv("DATABASE_URL","postgresql+psycopg2://postgres:postgres@db:5432/postgres")
+# помесячное секционирование stock_movements (см. backend/app/partitions.py)
+STOCK_PARTITIONING=os.getenv("STOCK_PARTITIONING","0")=="1"
 engine=create_engine(DATABASE_URL, future=True)
 SessionLocal=sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 Base=declarative_base()
@@ -12,3 +18,41 @@ def get_db():
     finally: db.close()
 
 
+# синхронный SQLAlchemy из асинхронного кода (фоновые циклы, вебхуки) — только через
+# этот пул, чтобы долгий цикл синхронизации или компакции не останавливал event loop.
+# Одну сессию из нескольких задач одновременно не используем: вызовы по ней идут по очереди.
+DB_WORKERS=int(os.getenv("DB_WORKERS","4"))
+_db_executor=ThreadPoolExecutor(DB_WORKERS, thread_name_prefix="db")
+async def run_db(fn, *args, **kwargs):
+    loop=asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(fn, *args, **kwargs))
+
+
+# обработчики запросов: DB_ASYNC=1 — AsyncSession на asyncpg (нужен sqlalchemy[asyncio]),
+# иначе прежняя синхронная Session, а вызовы идут в пул потоков AnyIO
+DB_ASYNC=os.getenv("DB_ASYNC","0")=="1"
+ASYNC_DATABASE_URL=os.getenv("ASYNC_DATABASE_URL", DATABASE_URL.replace("+psycopg2","+asyncpg"))
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    async_engine=create_async_engine(ASYNC_DATABASE_URL,
+                                     pool_size=int(os.getenv("DB_POOL_SIZE","10")),
+                                     max_overflow=int(os.getenv("DB_MAX_OVERFLOW","20")))
+    # expire_on_commit=False: после commit объекты отдаются в ответ без ленивой догрузки
+    AsyncSessionLocal=async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+async def get_session():
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db=SessionLocal()
+        try: yield db
+        finally: await run_in_threadpool(db.close)
+async def run(db, fn, *args, **kwargs):
+    """
+    fn(session, *args) над сессией из get_session: для AsyncSession — через run_sync
+    (тот же код crud, но ввод-вывод asyncpg без потоков), для Session — в пуле потоков.
+    ORM-объекты со связями превращайте в схемы внутри fn: после выхода ленивой загрузки нет.
+    """
+    if DB_ASYNC:
+        return await db.run_sync(lambda s: fn(s, *args, **kwargs))
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -0,0 +1,59 @@
+"""
+Хеширование паролей: один CryptContext на приложение и свой пул потоков.
+
+bcrypt — сотни миллисекунд CPU на хеш. Отдельный пул на HASH_WORKERS потоков
+не даёт всплеску логинов в начале смены занять общий threadpool обработчиков;
+очередь к нему ограничена HASH_QUEUE — сверх неё сразу 503, а не минуты ожидания.
+
+    BCRYPT_ROUNDS — целевая стоимость (12). Хеш другой стоимости при успешном
+                    входе пересчитывается и сохраняется (verify → new_hash).
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS  = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE    = int(os.getenv("HASH_QUEUE", "64"))
+
+# min = max = цель: хеш любой другой стоимости needs_update
+ctx = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+
+
+async def _submit(fn, *args):
+    global _pending
+    if _pending >= HASH_QUEUE:
+        raise HTTPException(status_code=503, detail="Server busy, retry later",
+                            headers={"Retry-After": "1"})
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(ctx.hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """(совпал ли пароль, новый хеш — если сохранённый надо пересчитать)."""
+    return await _submit(ctx.verify_and_update, password, hashed)
+
+
+def stats() -> dict:
+    return {"rounds": BCRYPT_ROUNDS, "workers": HASH_WORKERS,
+            "queue_limit": HASH_QUEUE, "pending": _pending}
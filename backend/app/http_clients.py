@@ -0,0 +1,92 @@
+"""
+Общие httpx.AsyncClient'ы на всё время жизни приложения.
+
+Модули регистрируют параметры клиента (`register("insales", base_url=…)`),
+а за клиентом обращаются через `get("insales")`: пул keep-alive соединений
+переиспользуется между запросами, TCP+TLS рукопожатие — только на новое соединение.
+Клиенты создаются на старте (`startup`) или при первом обращении, закрываются в `shutdown`.
+
+Настройки пула:
+    HTTP_MAX_CONNECTIONS   — всего соединений на клиент (20)
+    HTTP_MAX_KEEPALIVE     — сколько держать открытыми в простое (10)
+    HTTP_KEEPALIVE_EXPIRY  — сколько секунд держать простаивающее (30)
+    HTTP2=1                — включить HTTP/2 (нужен пакет h2)
+"""
+import os
+from collections import Counter, defaultdict
+from typing import Dict
+
+import httpx
+
+HTTP_MAX_CONNECTIONS  = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE    = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2                 = os.getenv("HTTP2", "0") == "1"
+
+_options: Dict[str, dict] = {}
+_clients: Dict[str, httpx.AsyncClient] = {}
+_counters: Dict[str, Counter] = defaultdict(Counter)
+
+
+def register(name: str, **options) -> None:
+    """Параметры клиента `name` (base_url, auth, timeout…)."""
+    _options[name] = options
+
+
+def _hooks(name: str) -> dict:
+    counters = _counters[name]
+
+    async def trace(event: str, info: dict) -> None:
+        # события httpcore: новое TCP-соединение и TLS-рукопожатие
+        if event == "connection.connect_tcp.complete":
+            counters["tcp_connects"] += 1
+        elif event == "connection.start_tls.complete":
+            counters["tls_handshakes"] += 1
+
+    async def on_request(request: httpx.Request) -> None:
+        counters["requests"] += 1
+        request.extensions["trace"] = trace
+
+    return {"request": [on_request]}
+
+
+def get(name: str) -> httpx.AsyncClient:
+    cli = _clients.get(name)
+    if cli is None or cli.is_closed:
+        cli = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=HTTP2,
+            event_hooks=_hooks(name),
+            **_options.get(name, {}),
+        )
+        _clients[name] = cli
+    return cli
+
+
+async def startup() -> None:
+    for name in _options:
+        get(name)
+
+
+async def shutdown() -> None:
+    for cli in list(_clients.values()):
+        await cli.aclose()
+    _clients.clear()
+
+
+def stats() -> dict:
+    """Счётчики запросов/рукопожатий и состояние пулов по каждому клиенту."""
+    out = {}
+    for name in _options:
+        info = dict(_counters[name])
+        cli = _clients.get(name)
+        pool = getattr(getattr(cli, "_transport", None), "_pool", None)
+        conns = list(getattr(pool, "connections", []) or [])
+        info["open_connections"] = len(conns)
+        info["idle_connections"] = sum(1 for c in conns if c.is_idle())
+        out[name] = info
+    return out
@@ -0,0 +1,127 @@
+"""
+Выборы лидера для фоновых задач через advisory-lock PostgreSQL.
+
+При `uvicorn --workers N` (или нескольких контейнерах) каждый процесс стартует
+фоновые циклы, но работает только тот, кто держит сессионный advisory-lock
+задачи; остальные раз в LEADER_RETRY секунд пробуют его взять.
+
+Лок живёт, пока живо соединение держателя: процесс упал или убит — PostgreSQL
+закрывает сессию и отпускает лок, следующий претендент подхватывает задачу.
+Держатель раз в LEADER_CHECK секунд пингует своё соединение; если оно порвалось,
+задача отменяется, чтобы не работать параллельно с новым лидером.
+
+Соединения с локами — из своего движка без пула (NullPool), а не из общего:
+лидер держит по соединению на задачу постоянно, и из пула engine, которым
+пользуются run_db и обработчики, они бы выели pool_size.
+
+    LEADER_RETRY   — как часто претендент пробует взять лок (15 с)
+    LEADER_CHECK   — как часто лидер проверяет своё соединение (10 с)
+"""
+import asyncio
+import logging
+import os
+import zlib
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import NullPool
+
+from backend.app.database import DATABASE_URL, run_db
+
+log = logging.getLogger("leader")
+
+LEADER_RETRY = float(os.getenv("LEADER_RETRY", "15"))
+LEADER_CHECK = float(os.getenv("LEADER_CHECK", "10"))
+
+# соединение с локом в пул не возвращается (см. Lease._drop) — пул ему и не нужен
+_engine = create_engine(DATABASE_URL, poolclass=NullPool, future=True)
+
+# старшие 32 бита ключа — «lead», младшие — crc32 имени задачи
+_NAMESPACE = 0x6C656164
+
+
+class Lease:
+    """Сессионный advisory-lock задачи на отдельном соединении (autocommit)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.key  = (_NAMESPACE << 32) | zlib.crc32(name.encode())
+        self.conn: Optional[Connection] = None
+
+    def acquire(self) -> bool:
+        if self.conn is None:
+            self.conn = _engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            got = self.conn.execute(select(func.pg_try_advisory_lock(self.key))).scalar()
+        except Exception:
+            self._drop()
+            raise
+        if not got:
+            # соединение не держим, пока лидер не мы
+            self._drop()
+        return bool(got)
+
+    def alive(self) -> bool:
+        if self.conn is None:
+            return False
+        try:
+            self.conn.execute(select(1))
+            return True
+        except Exception:
+            self._drop()
+            return False
+
+    def release(self) -> None:
+        if self.conn is None:
+            return
+        try:
+            self.conn.execute(select(func.pg_advisory_unlock(self.key)))
+        except Exception:
+            pass                        # соединение уже мертво — лок отпущен вместе с ним
+        self._drop()
+
+    def _drop(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.invalidate()   # в пул не возвращаем: сессия с локом или битая
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+
+async def run_as_leader(name: str, job: Callable[[], Awaitable[None]]) -> None:
+    """
+    Бесконечно: ждём лидерства в задаче `name`, запускаем job(), следим за локом.
+    Потеряли лок — отменяем job; job завершилась или упала — отпускаем лок
+    и снова встаём в очередь претендентов.
+    """
+    lease = Lease(name)
+    while True:
+        try:
+            got = await run_db(lease.acquire)
+        except Exception:
+            log.exception("%s: не удалось запросить лидерство", name)
+            got = False
+        if not got:
+            await asyncio.sleep(LEADER_RETRY)
+            continue
+
+        log.info("%s: этот процесс — лидер (pid %s)", name, os.getpid())
+        task = asyncio.create_task(job())
+        try:
+            while not task.done():
+                done, _ = await asyncio.wait({task}, timeout=LEADER_CHECK)
+                if not done and not await run_db(lease.alive):
+                    log.warning("%s: соединение с локом потеряно, останавливаем задачу", name)
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            await run_db(lease.release)
+
+        if not task.cancelled() and task.exception():
+            log.error("%s: задача упала", name, exc_info=task.exception())
+        await asyncio.sleep(LEADER_RETRY)
@@ -0,0 +1,187 @@
+"""
+Живые обновления для collector.html: Server-Sent Events (GET /api/live/).
+
+Один рассыльщик на процесс. Он слушает новые версии ресурсов
+(backend/app/resources.py: commit в этом процессе или NOTIFY из воркера),
+один раз перечитывает изменившийся ресурс и рассылает всем подключённым
+разницу с прошлым снимком:
+
+    event: stock   data: {"full": false, "upsert": [строки остатков], "remove": [id]}
+    event: films   data: {"full": false, "upsert": [плёнки], "remove": [sku]}
+
+Новый клиент сначала получает полный снимок (full: true). Без клиентов
+рассыльщик ничего не читает. Страховка от потерянных сигналов — сверка
+раз в LIVE_RESYNC секунд (пустая разница никуда не уходит).
+
+    LIVE_DEBOUNCE  — сколько ждать после сигнала: пачка commit синхронизации → одна рассылка (0.5 с)
+    LIVE_HEARTBEAT — комментарий-пинг, чтобы прокси не рвали простаивающий поток (15 с)
+    LIVE_QUEUE     — сообщений в очереди клиента; отстал сильнее — отключаем,
+                     EventSource переподключится и получит полный снимок (32)
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from backend.app import crud, models, resources
+from backend.app.database import SessionLocal, run_db
+
+log = logging.getLogger("live")
+
+LIVE_DEBOUNCE  = float(os.getenv("LIVE_DEBOUNCE", "0.5"))
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", "15"))
+LIVE_RESYNC    = float(os.getenv("LIVE_RESYNC", "60"))
+LIVE_QUEUE     = int(os.getenv("LIVE_QUEUE", "32"))
+RETRY_MS       = 5000            # пауза переподключения EventSource
+
+
+def _stock(db: Session) -> List[dict]:
+    return crud.stock_materials(db)
+
+
+def _films(db: Session) -> List[dict]:
+    rows = (
+        db.query(models.ReadyFilm.sku, models.ReadyFilm.title, models.ReadyFilm.quantity)
+        .order_by(models.ReadyFilm.title)
+        .all()
+    )
+    return [{"sku": sku, "title": title, "quantity": qty} for sku, title, qty in rows]
+
+
+# ресурс → (событие SSE, ключ строки, чтение)
+FEEDS: Dict[str, tuple] = {
+    resources.MATERIALS: ("stock", "id",  _stock),
+    resources.FILMS:     ("films", "sku", _films),
+}
+
+
+def _load(fn: Callable[[Session], List[dict]]) -> List[dict]:
+    with SessionLocal() as db:
+        return fn(db)
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class Broadcaster:
+    def __init__(self):
+        self._clients: Set[asyncio.Queue] = set()
+        self._snapshots: Dict[str, Dict[object, dict]] = {}
+        self._dirty: Set[str] = set()
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        resources.versions.listen(self.mark)
+
+    # ——— сигналы ———
+    def mark(self, name: Optional[str]) -> None:
+        """Ресурс изменился (None — все). Из любого потока."""
+        if self._loop is None or self._loop.is_closed():
+            return                                  # в этом процессе никто не подключался
+        self._loop.call_soon_threadsafe(self._mark, name)
+
+    def _mark(self, name: Optional[str]) -> None:
+        if name is None:
+            self._dirty.update(FEEDS)
+        elif name in FEEDS:
+            self._dirty.add(name)
+        else:
+            return
+        self._wake.set()
+
+    # ——— снимки ———
+    async def _refresh(self, name: str) -> None:
+        """Перечитать ресурс и разослать разницу. Только под self._lock."""
+        event, key, fn = FEEDS[name]
+        rows = {r[key]: r for r in await run_db(_load, fn)}
+        old = self._snapshots.get(name)
+        self._snapshots[name] = rows
+        if old is None:
+            return
+        upsert = [r for k, r in rows.items() if old.get(k) != r]
+        remove = [k for k in old if k not in rows]
+        if upsert or remove:
+            self._send(_event(event, {"full": False, "upsert": upsert, "remove": remove}))
+
+    def _send(self, message: Optional[str]) -> None:
+        for q in list(self._clients):
+            try:
+                q.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(q)
+
+    def _drop(self, q: asyncio.Queue) -> None:
+        self._clients.discard(q)
+        while not q.empty():
+            q.get_nowait()
+        q.put_nowait(None)                          # поток клиента завершится
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), LIVE_RESYNC)
+                await asyncio.sleep(LIVE_DEBOUNCE)
+            except asyncio.TimeoutError:
+                self._dirty.update(FEEDS)
+            self._wake.clear()
+            dirty, self._dirty = self._dirty, set()
+            async with self._lock:
+                if not self._clients:
+                    self._snapshots.clear()         # без клиентов снимок устареет
+                    continue
+                for name in dirty:
+                    try:
+                        await self._refresh(name)
+                    except Exception:
+                        log.exception("Не удалось обновить %s для живых клиентов", name)
+
+    # ——— клиенты ———
+    async def subscribe(self) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        q: asyncio.Queue = asyncio.Queue(LIVE_QUEUE)
+        async with self._lock:
+            for name in FEEDS:
+                if name not in self._snapshots:
+                    await self._refresh(name)
+            # снимок и подписка — без await между ними: следующая разница считается от него же
+            for name, (event, _, _) in FEEDS.items():
+                q.put_nowait(_event(event, {"full": True,
+                                            "upsert": list(self._snapshots[name].values()),
+                                            "remove": []}))
+            self._clients.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self._clients.discard(q)
+
+    async def stream(self, until: Optional[float] = None) -> AsyncIterator[str]:
+        """Поток SSE одного клиента; until — срок токена (epoch), после него закрываем."""
+        q = await self.subscribe()
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while until is None or time.time() < until:
+                try:
+                    message = await asyncio.wait_for(q.get(), LIVE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(q)
+
+    def stats(self) -> dict:
+        return {"clients": len(self._clients),
+                "snapshots": {n: len(s) for n, s in self._snapshots.items()}}
+
+
+broadcaster = Broadcaster()
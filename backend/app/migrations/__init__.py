@@ -0,0 +1,67 @@
+"""
+Версионные миграции схемы.
+
+Запускаются отдельной командой (не при импорте приложения):
+
+    python -m backend.app.migrations upgrade   # применить недостающие
+    python -m backend.app.migrations status    # что применено
+    python -m backend.app.migrations check     # EXPLAIN горячих запросов
+
+Каждая миграция — функция (conn) → None в versions.py, выполняется
+в своей транзакции; применённые версии пишутся в schema_migrations.
+"""
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from backend.app.database import engine, STOCK_PARTITIONING
+from backend.app.migrations.versions import MIGRATIONS
+
+log = logging.getLogger("migrations")
+
+# один ключ advisory-lock на все раннеры, чтобы два контейнера не мигрировали разом
+_LOCK_KEY = 0x6D696772  # "migr"
+
+
+def _ensure_table(conn) -> None:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version    INTEGER PRIMARY KEY,"
+        " name       VARCHAR NOT NULL,"
+        " applied_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'))"
+    ))
+
+
+def applied_versions(conn) -> List[int]:
+    _ensure_table(conn)
+    return conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+
+
+def status() -> List[Tuple[int, str, bool]]:
+    with engine.begin() as conn:
+        done = set(applied_versions(conn))
+    return [(v, name, v in done) for v, name, _ in MIGRATIONS]
+
+
+def upgrade() -> int:
+    """Применяем недостающие миграции по порядку. Возвращаем число применённых."""
+    applied = 0
+    for version, name, fn in MIGRATIONS:
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+            if version in applied_versions(conn):
+                continue
+            log.info("Миграция %04d %s", version, name)
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                {"v": version, "n": name},
+            )
+            applied += 1
+
+    if STOCK_PARTITIONING:
+        from backend.app import partitions
+        with engine.begin() as conn:
+            partitions.ensure_partitions(conn)
+    return applied
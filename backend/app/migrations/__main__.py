@@ -0,0 +1,24 @@
+import sys
+import logging
+
+from backend.app import migrations
+from backend.app.migrations.check import check
+
+logging.basicConfig(level=logging.INFO)
+
+cmd = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+
+if cmd == "upgrade":
+    n = migrations.upgrade()
+    print(f"applied: {n}")
+elif cmd == "status":
+    for version, name, done in migrations.status():
+        print(f"{version:04d} {name:<24} {'applied' if done else 'pending'}")
+elif cmd == "check":
+    orders = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    problems = check(orders=orders)
+    for p in problems:
+        print("FAIL", p)
+    sys.exit(1 if problems else 0)
+else:
+    raise SystemExit(f"неизвестная команда: {cmd}")
@@ -0,0 +1,111 @@
+"""
+Проверка планов горячих запросов: EXPLAIN на засеянных данных.
+
+Внутри одной транзакции засеваем материалы/заказы/строки/движения,
+делаем ANALYZE, снимаем EXPLAIN (FORMAT JSON) и откатываем всё обратно.
+Провал — если по большой таблице в плане появился Seq Scan.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import select, text
+
+from backend.app.database import engine
+from backend.app import models
+
+log = logging.getLogger("migrations")
+
+# таблицы, которые растут с каждым заказом — по ним seq scan недопустим
+HOT_TABLES = ("stock_movements", "order_lines", "orders")
+
+
+def _seed(conn, orders: int, materials: int) -> Tuple[int, int]:
+    """Засеваем данные; возвращаем (id материала, id заказа) для запросов."""
+    conn.execute(text(
+        "INSERT INTO materials (name, unit, base_qty, min_qty, alerted) "
+        "SELECT '__explain_seed_' || g, 'шт', 0, 0, false "
+        "FROM generate_series(1, :n) g"
+    ), {"n": materials})
+    first_mat = conn.execute(text(
+        "SELECT MIN(id) FROM materials WHERE name LIKE '__explain_seed_%'"
+    )).scalar()
+    base = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM orders")).scalar()
+
+    conn.execute(text(
+        "INSERT INTO orders (id, number, created_at, ignored, ready_notified, client_notified) "
+        "SELECT :base + g, (:base + g)::text, "
+        "       (now() AT TIME ZONE 'utc') - g * interval '1 minute', false, false, false "
+        "FROM generate_series(1, :n) g"
+    ), {"base": base, "n": orders})
+    conn.execute(text(
+        "INSERT INTO order_lines (order_id, product_id, product_title, quantity) "
+        "SELECT :base + g, l, 'seed product ' || l, 1 "
+        "FROM generate_series(1, :n) g, generate_series(1, 3) l"
+    ), {"base": base, "n": orders})
+    conn.execute(text(
+        "INSERT INTO stock_movements (material_id, order_id, qty, created_at) "
+        "SELECT :mat + (g * 3 + l) % :m, :base + g, -1, "
+        "       (now() AT TIME ZONE 'utc') - g * interval '1 minute' "
+        "FROM generate_series(1, :n) g, generate_series(1, 3) l"
+    ), {"mat": first_mat, "m": materials, "base": base, "n": orders})
+
+    for t in HOT_TABLES:
+        conn.execute(text(f"ANALYZE {t}"))
+    return first_mat, base + orders // 2
+
+
+def hot_queries(material_id: int, order_id: int) -> List[Tuple[str, object]]:
+    """Запросы, повторяющие crud.py и routes/materials.py."""
+    SM, OL, O = models.StockMovement, models.OrderLine, models.Order
+    return [
+        ("materials.history",
+         select(SM, O.number).outerjoin(O, O.id == SM.order_id)
+         .where(SM.material_id == material_id)
+         .order_by(SM.created_at.desc()).limit(50)),
+        ("crud._apply_rules / ignore_order",
+         select(SM).where(SM.order_id == order_id)),
+        ("crud._sync_lines (order lines)",
+         select(OL).where(OL.order_id == order_id)),
+        ("crud.upsert_order (get order)",
+         select(O).where(O.id == order_id)),
+        ("crud.compact_movements",
+         select(SM.id).where(SM.created_at < datetime.utcnow() - timedelta(days=3650))
+         .order_by(SM.id).limit(5000)),
+    ]
+
+
+def _walk(plan: dict) -> Iterator[dict]:
+    yield plan
+    for sub in plan.get("Plans", []):
+        yield from _walk(sub)
+
+
+def _seq_scans(plan: dict) -> List[str]:
+    out = []
+    for node in _walk(plan):
+        rel = node.get("Relation Name", "")
+        if node.get("Node Type") == "Seq Scan" and rel.startswith(HOT_TABLES):
+            out.append(rel)
+    return out
+
+
+def check(orders: int = 20000, materials: int = 50) -> List[str]:
+    """Возвращаем список проблем (пустой — всё хорошо)."""
+    problems = []
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            material_id, order_id = _seed(conn, orders, materials)
+            for name, stmt in hot_queries(material_id, order_id):
+                compiled = stmt.compile(dialect=conn.dialect)
+                plan = conn.exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+                ).scalar()[0]["Plan"]
+                scans = _seq_scans(plan)
+                log.info("%-36s %s", name, "seq scan: " + ", ".join(scans) if scans else "ok")
+                if scans:
+                    problems.append(f"{name}: Seq Scan on {', '.join(scans)}")
+        finally:
+            trans.rollback()
+    return problems
@@ -0,0 +1,126 @@
+"""
+Список миграций: (версия, имя, функция(conn)).
+
+Новые миграции только дописываются в конец; уже выпущенные не меняем.
+DDL пишем идемпотентно (IF NOT EXISTS) — базы, созданные старым
+create_all при импорте, проходят те же шаги без ошибок.
+"""
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.app.database import Base
+from backend.app import models
+
+
+def m0001_initial(conn) -> None:
+    """Таблицы по моделям (существующие не трогаются)."""
+    Base.metadata.create_all(bind=conn)
+
+
+def m0002_material_balances(conn) -> None:
+    """Достраиваем material_balances из журнала для баз, где их ещё не было."""
+    # crud тянет telegram, outbox и прочие модули приложения — миграциям они
+    # не нужны, а импорт при старте `python -m backend.app.migrations` им опасен
+    from backend.app import crud
+
+    with Session(bind=conn) as db:
+        crud.check_balances(db, fix=True)
+
+
+def m0003_hot_path_indexes(conn) -> None:
+    """
+    Индексы под горячие запросы:
+    • история материала и его остатки   — (material_id, created_at) + qty, order_id;
+    • пересчёт / игнор заказа           — stock_movements(order_id), order_lines(order_id);
+    • компакция и /stats/totals         — stock_movements(created_at) + material_id, qty;
+    • список заказов                    — orders(created_at).
+    """
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS ix_stock_movements_material_created "
+        "ON stock_movements (material_id, created_at) INCLUDE (qty, order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_stock_movements_order "
+        "ON stock_movements (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_stock_movements_created "
+        "ON stock_movements (created_at) INCLUDE (material_id, qty)",
+        "CREATE INDEX IF NOT EXISTS ix_order_lines_order "
+        "ON order_lines (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_orders_created "
+        "ON orders (created_at)",
+    ):
+        conn.execute(text(ddl))
+    conn.execute(text("ANALYZE stock_movements"))
+    conn.execute(text("ANALYZE order_lines"))
+    conn.execute(text("ANALYZE orders"))
+
+
+def m0004_order_fingerprint(conn) -> None:
+    """Отпечаток заказа: неизменившиеся заказы upsert_order пропускает."""
+    conn.execute(text(
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)"
+    ))
+
+
+def m0005_webhook_events(conn) -> None:
+    """Очередь входящих вебхуков InSales."""
+    models.WebhookEvent.__table__.create(bind=conn, checkfirst=True)
+
+
+
+def m0006_telegram_outbox(conn) -> None:
+    """Очередь исходящих сообщений Telegram."""
+    models.OutboxMessage.__table__.create(bind=conn, checkfirst=True)
+
+
+def m0007_rate_limits(conn) -> None:
+    """Общие счётчики rate-limit для всех процессов API."""
+    models.RateLimitCounter.__table__.create(bind=conn, checkfirst=True)
+
+
+def m0008_resource_versions(conn) -> None:
+    """Версии ресурсов для условных GET: materials и films."""
+    models.ResourceVersion.__table__.create(bind=conn, checkfirst=True)
+    conn.execute(text(
+        "INSERT INTO resource_versions (name, version, updated_at) "
+        "VALUES ('materials', 1, now() AT TIME ZONE 'utc'), ('films', 1, now() AT TIME ZONE 'utc') "
+        "ON CONFLICT (name) DO NOTHING"
+    ))
+
+
+def m0009_order_compacted(conn) -> None:
+    """
+    orders.compacted — движения заказа свёрнуты в снимки. Для уже свёрнутого
+    журнала точнее не узнать: помечаем заказы до водяного знака компакции,
+    у которых движений не осталось (прежнее правило, но без заказов,
+    чьи движения записаны позже знака).
+    """
+    conn.execute(text(
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS compacted BOOLEAN NOT NULL DEFAULT false"
+    ))
+    conn.execute(text(
+        "UPDATE orders o SET compacted = true "
+        "FROM checkpoints c "
+        "WHERE c.name = 'ledger_compacted_until' "
+        "AND o.created_at < c.value::timestamp "
+        "AND NOT EXISTS (SELECT 1 FROM stock_movements m WHERE m.order_id = o.id)"
+    ))
+
+
+def m0010_order_updated_at(conn) -> None:
+    """orders.updated_at — версия заказа в InSales, чтобы не применять устаревшие вебхуки."""
+    conn.execute(text(
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP"
+    ))
+
+
+MIGRATIONS = [
+    (1, "initial",            m0001_initial),
+    (2, "material_balances",  m0002_material_balances),
+    (3, "hot_path_indexes",   m0003_hot_path_indexes),
+    (4, "order_fingerprint",  m0004_order_fingerprint),
+    (5, "webhook_events",     m0005_webhook_events),
+    (6, "telegram_outbox",    m0006_telegram_outbox),
+    (7, "rate_limits",        m0007_rate_limits),
+    (8, "resource_versions",  m0008_resource_versions),
+    (9, "order_compacted",    m0009_order_compacted),
+    (10, "order_updated_at",  m0010_order_updated_at),
+]
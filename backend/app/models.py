@@ -8,15 +8,18 @@ from sqlalchemy import (
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     BigInteger,
     String,
     Float,
+    Text,
+    text,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
-from backend.app.database import Base
+from backend.app.database import Base, STOCK_PARTITIONING
 
 
 # ---------- User & Roles ----------
@@ -48,7 +51,17 @@ class Material(Base):
     base_qty = Column(Float, default=0.0, nullable=False)
     min_qty  = Column(Float, default=0.0, nullable=False)
     alerted  = Column(Boolean, default=False, nullable=False)  # уже слали TG-уведомление
-    
+
+
+class MaterialBalance(Base):
+    """
+    Текущая сумма движений по материалу (поддерживается вместе с stock_movements):
+    свёрнутый снимок material_snapshots + ещё не свёрнутые движения.
+    """
+    __tablename__ = "material_balances"
+
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), primary_key=True)
+    qty         = Column(Float, default=0.0, nullable=False)
 
 
 class MaterialRule(Base):
@@ -66,6 +79,9 @@ class MaterialRule(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_created", "created_at"),
+    )
 
     id             = Column(Integer, primary_key=True)
     number         = Column(String, index=True, nullable=False)
@@ -74,12 +90,18 @@ class Order(Base):
     ignored        = Column(Boolean, default=False, nullable=False)
     ready_notified = Column(Boolean, default=False, nullable=False)  # уведомление о готовых плёнках отправлено?
     client_notified = Column(Boolean, default=False, nullable=False)
+    fingerprint    = Column(String(64))  # отпечаток последнего upsert (см. crud.order_fingerprint)
+    compacted      = Column(Boolean, default=False, nullable=False)  # движения свёрнуты в снимки — правила не применяем
+    updated_at     = Column(DateTime)    # updated_at записанной версии в InSales: старые вебхуки её не перетирают
 
     lines = relationship("OrderLine", back_populates="order", cascade="all, delete-orphan")
 
 
 class OrderLine(Base):
     __tablename__ = "order_lines"
+    __table_args__ = (
+        Index("ix_order_lines_order", "order_id"),
+    )
 
     id            = Column(Integer, primary_key=True, autoincrement=True)
     order_id      = Column(BigInteger, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
@@ -95,12 +117,109 @@ class OrderLine(Base):
 
 class StockMovement(Base):
     __tablename__ = "stock_movements"
-
-    id          = Column(Integer, primary_key=True)
+    __table_args__ = (
+        Index("ix_stock_movements_material_created", "material_id", "created_at",
+              postgresql_include=["qty", "order_id"]),
+        Index("ix_stock_movements_order", "order_id"),
+        Index("ix_stock_movements_created", "created_at",
+              postgresql_include=["material_id", "qty"]),
+        # при секционировании по месяцам ключ секции обязан входить в PK
+        {"postgresql_partition_by": "RANGE (created_at)"} if STOCK_PARTITIONING else {},
+    )
+
+    id          = Column(Integer, primary_key=True, autoincrement=True)
     material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
     order_id    = Column(BigInteger, ForeignKey("orders.id"), nullable=True)
     qty         = Column(Float, nullable=False)
-    created_at  = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at  = Column(DateTime, default=datetime.utcnow, nullable=False,
+                         primary_key=STOCK_PARTITIONING)
+
+
+class MaterialSnapshot(Base):
+    """Начальный остаток: сумма движений, свёрнутых компакцией журнала."""
+    __tablename__ = "material_snapshots"
+
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), primary_key=True)
+    qty         = Column(Float, default=0.0, nullable=False)
+    as_of       = Column(DateTime, nullable=False)  # движения раньше этой даты уже в qty
+
+
+# ---------- Service state ----------
+
+class Checkpoint(Base):
+    """Служебные отметки фоновых задач (водяные знаки, курсоры)."""
+    __tablename__ = "checkpoints"
+
+    name       = Column(String, primary_key=True)
+    value      = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+# ---------- InSales webhooks ----------
+
+class WebhookEvent(Base):
+    """Входящее событие InSales о заказе: очередь для фонового обработчика."""
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        Index("ix_webhook_events_pending", "id", postgresql_where=text("processed_at IS NULL")),
+    )
+
+    id           = Column(BigInteger, primary_key=True, autoincrement=True)
+    topic        = Column(String, nullable=False)              # orders/create, orders/update
+    order_id     = Column(BigInteger, nullable=False, index=True)
+    payload      = Column(Text, nullable=False)                # JSON заказа как пришёл
+    received_at  = Column(DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = Column(DateTime)
+    attempts     = Column(Integer, default=0, nullable=False)
+    error        = Column(String)
+
+
+# ---------- Telegram outbox ----------
+
+class OutboxMessage(Base):
+    """
+    Исходящее сообщение Telegram. Пишется той же транзакцией, что и флаг
+    (ready_notified / client_notified / alerted), отправляется outbox-отправителем.
+    """
+    __tablename__ = "telegram_outbox"
+    __table_args__ = (
+        Index("ix_telegram_outbox_due", "next_attempt_at", postgresql_where=text("sent_at IS NULL")),
+    )
+
+    id              = Column(BigInteger, primary_key=True, autoincrement=True)
+    chat_id         = Column(String, nullable=False)
+    text            = Column(Text, nullable=False)
+    created_at      = Column(DateTime, default=datetime.utcnow, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    attempts        = Column(Integer, default=0, nullable=False)
+    sent_at         = Column(DateTime)
+    error           = Column(String)
+
+
+# ---------- Rate limits ----------
+
+class RateLimitCounter(Base):
+    """
+    Счётчик фиксированного окна для slowapi (backend/app/ratelimit.py).
+    UNLOGGED: без WAL — дёшево на каждый запрос, после сбоя PG счётчики обнуляются.
+    """
+    __tablename__ = "rate_limits"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key        = Column(String, primary_key=True)
+    count      = Column(Integer, nullable=False)
+    expires_at = Column(Float, nullable=False)      # epoch-секунды по часам PostgreSQL
+
+
+# ---------- Resource versions (ETag) ----------
+
+class ResourceVersion(Base):
+    """Счётчик изменений ресурса для ETag (backend/app/resources.py)."""
+    __tablename__ = "resource_versions"
+
+    name       = Column(String, primary_key=True)
+    version    = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
 # ---------- Ready Films (склад готовых плёнок) ----------
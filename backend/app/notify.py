@@ -0,0 +1,94 @@
+"""
+Сигналы между процессами через PostgreSQL LISTEN/NOTIFY.
+
+    publish(db, channel, payload)   — в транзакции вызывающего, уходит при commit
+    subscribe(channel, callback)    — callback(payload) в event loop этого процесса
+    start() / stop()                — поток-слушатель на отдельном соединении
+
+После (пере)подключения слушателя каждый подписчик получает payload=None:
+сигналы за время обрыва могли потеряться — сбросьте всё, что кешировали.
+
+PG_NOTIFY=0 — выключить (кеши тогда живут только по своему TTL).
+"""
+import asyncio
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy import select as sa_select
+from sqlalchemy.orm import Session
+
+from backend.app.database import engine
+
+log = logging.getLogger("notify")
+
+PG_NOTIFY = os.getenv("PG_NOTIFY", "1") == "1"
+RECONNECT = 5.0
+
+_handlers: Dict[str, List[Callable[[Optional[str]], None]]] = defaultdict(list)
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def publish(db: Session, channel: str, payload: str = "") -> None:
+    if PG_NOTIFY:
+        db.execute(sa_select(func.pg_notify(channel, payload)))
+
+
+def subscribe(channel: str, callback: Callable[[Optional[str]], None]) -> None:
+    """Подписываться до start(): каналы слушаются с момента подключения."""
+    _handlers[channel].append(callback)
+
+
+def _dispatch(loop: asyncio.AbstractEventLoop, channel: str, payload: Optional[str]) -> None:
+    for cb in _handlers.get(channel, ()):
+        loop.call_soon_threadsafe(cb, payload)
+
+
+def _listen(loop: asyncio.AbstractEventLoop) -> None:
+    while not _stop.is_set():
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            raw.detach()                          # соединение слушателя в пул не вернётся
+            conn = raw.dbapi_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for channel in list(_handlers):
+                    cur.execute(f'LISTEN "{channel}"')
+            for channel in list(_handlers):
+                _dispatch(loop, channel, None)
+            while not _stop.is_set():
+                if select.select([conn], [], [], RECONNECT) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    n = conn.notifies.pop(0)
+                    _dispatch(loop, n.channel, n.payload)
+        except Exception:
+            log.exception("Слушатель NOTIFY упал, переподключаемся")
+            _stop.wait(RECONNECT)
+        finally:
+            if raw is not None:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+
+def start() -> None:
+    global _thread
+    if not PG_NOTIFY or not _handlers or (_thread and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_listen, args=(asyncio.get_running_loop(),),
+                               name="pg-notify", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
@@ -0,0 +1,154 @@
+"""
+Отправитель Telegram outbox (таблица telegram_outbox).
+
+Уведомления не отправляются из синхронизации: crud.enqueue_message пишет их
+той же транзакцией, что и флаг (ready_notified / client_notified / alerted),
+а этот цикл разбирает очередь:
+
+• строки берутся `FOR UPDATE SKIP LOCKED` и остаются заблокированными до commit
+  с отметкой sent_at — второй отправитель их не увидит;
+• несколько сообщений в один чат склеиваются в дайджест (до 4096 символов);
+• на чат не больше OUTBOX_CHAT_RATE сообщений в минуту — остальное ждёт
+  и попадёт в следующий дайджест;
+• ошибка — повтор с экспоненциальной паузой (или retry_after из 429),
+  после OUTBOX_MAX_ATTEMPTS попыток сообщение остаётся в таблице с ошибкой.
+
+Каждое сообщение уходит один раз; повтор возможен лишь если процесс упадёт
+между ответом Telegram и commit.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from backend.app import models, telegram
+from backend.app.database import SessionLocal, run_db
+
+log = logging.getLogger("outbox")
+
+OUTBOX_BATCH        = 200
+OUTBOX_POLL         = float(os.getenv("OUTBOX_POLL", "2"))
+OUTBOX_CHAT_RATE    = int(os.getenv("OUTBOX_CHAT_RATE", "20"))     # сообщений в минуту на чат
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+BACKOFF_BASE        = 5.0
+BACKOFF_MAX         = 3600.0
+
+# будит отправителя сразу после постановки сообщения в этом же процессе
+wakeup = asyncio.Event()
+
+_sent_at: Dict[str, Deque[float]] = defaultdict(deque)
+
+
+def _chat_budget(chat_id: str) -> int:
+    """Сколько сообщений ещё можно отправить в чат в текущую минуту."""
+    sent, now = _sent_at[chat_id], time.monotonic()
+    while sent and now - sent[0] > 60:
+        sent.popleft()
+    return OUTBOX_CHAT_RATE - len(sent)
+
+
+def _claim(db: Session) -> List[models.OutboxMessage]:
+    """Созревшие сообщения; блокировки держатся до commit в _finish."""
+    return (
+        db.query(models.OutboxMessage)
+        .filter(models.OutboxMessage.sent_at.is_(None),
+                models.OutboxMessage.next_attempt_at <= datetime.utcnow(),
+                models.OutboxMessage.attempts < OUTBOX_MAX_ATTEMPTS)
+        .order_by(models.OutboxMessage.id)
+        .limit(OUTBOX_BATCH)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+def _digests(msgs: List[models.OutboxMessage]) -> List[Tuple[List[int], str]]:
+    """Склеиваем сообщения чата в дайджесты, не длиннее лимита Telegram."""
+    out: List[Tuple[List[int], List[str]]] = []
+    size = 0
+    for m in msgs:
+        text = m.text[:telegram.MAX_TEXT - 64]
+        if not out or size + len(text) + 2 > telegram.MAX_TEXT - 64:
+            out.append(([], []))
+            size = 0
+        out[-1][0].append(m.id)
+        out[-1][1].append(text)
+        size += len(text) + 2
+    return [
+        (ids, texts[0] if len(texts) == 1 else f"🔔 Уведомлений: {len(texts)}\n\n" + "\n\n".join(texts))
+        for ids, texts in out
+    ]
+
+
+def _finish(db: Session, sent: List[int], failed: Dict[int, Tuple[str, float]]) -> None:
+    now = datetime.utcnow()
+    if sent:
+        db.query(models.OutboxMessage)\
+          .filter(models.OutboxMessage.id.in_(sent))\
+          .update({models.OutboxMessage.sent_at: now, models.OutboxMessage.error: None},
+                  synchronize_session=False)
+    for mid, (error, delay) in failed.items():
+        db.query(models.OutboxMessage)\
+          .filter(models.OutboxMessage.id == mid)\
+          .update({models.OutboxMessage.attempts: models.OutboxMessage.attempts + 1,
+                   models.OutboxMessage.error: error[:500],
+                   models.OutboxMessage.next_attempt_at: now + timedelta(seconds=delay)},
+                  synchronize_session=False)
+    db.commit()
+
+
+async def drain(db: Session) -> int:
+    """Один проход по очереди. Возвращаем число отправленных сообщений."""
+    rows = await run_db(_claim, db)
+    if not rows:
+        await run_db(db.rollback)
+        return 0
+
+    by_chat: Dict[str, List[models.OutboxMessage]] = defaultdict(list)
+    for m in rows:
+        by_chat[m.chat_id].append(m)
+    attempts = {m.id: m.attempts for m in rows}
+
+    sent: List[int] = []
+    failed: Dict[int, Tuple[str, float]] = {}
+    for chat_id, msgs in by_chat.items():
+        for ids, text in _digests(msgs):
+            if _chat_budget(chat_id) <= 0:
+                break                   # остальное — в следующем проходе
+            try:
+                await telegram.deliver(chat_id, text)
+            except telegram.SendError as exc:
+                log.warning("Telegram не принял сообщение в чат %s: %s", chat_id, exc)
+                for mid in ids:
+                    delay = min(BACKOFF_BASE * 2 ** attempts[mid], BACKOFF_MAX)
+                    failed[mid] = (str(exc), max(delay, exc.retry_after or 0))
+                break                   # чат недоступен — не бьёмся в него дальше
+            _sent_at[chat_id].append(time.monotonic())
+            sent.extend(ids)
+
+    await run_db(_finish, db, sent, failed)
+    return len(sent)
+
+
+async def sender_job() -> None:
+    while True:
+        db = SessionLocal()
+        try:
+            # полная пачка — значит, в очереди есть ещё
+            while await drain(db) >= OUTBOX_BATCH:
+                pass
+        except Exception:
+            await run_db(db.rollback)
+            log.exception("Отправитель outbox упал")
+        finally:
+            await run_db(db.close)
+
+        try:
+            await asyncio.wait_for(wakeup.wait(), OUTBOX_POLL)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
@@ -0,0 +1,181 @@
+"""
+Помесячное секционирование stock_movements (PostgreSQL, STOCK_PARTITIONING=1).
+
+Секции называются stock_movements_YYYY_MM и покрывают [1-е число; 1-е след. месяца).
+Удержание журнала сворачивает и удаляет секции целиком вместо построчного DELETE.
+
+    python -m backend.app.partitions migrate   # перенести существующую таблицу
+    python -m backend.app.partitions ensure    # создать секции на ближайшие месяцы
+"""
+import os
+import sys
+import logging
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.app.database import engine, STOCK_PARTITIONING
+from backend.app import crud, models
+
+log = logging.getLogger("partitions")
+
+MONTHS_AHEAD = int(os.getenv("STOCK_PARTITIONS_AHEAD", "3"))
+PARENT       = models.StockMovement.__tablename__
+
+
+# ---------------------------------------------------------------------
+# helpers
+# ---------------------------------------------------------------------
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def _name(month: date) -> str:
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def is_partitioned(conn) -> bool:
+    return bool(conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :t)"
+    ), {"t": PARENT}).scalar())
+
+
+def list_partitions(conn) -> List[Tuple[str, date, date]]:
+    """[(имя, начало, конец)] по секциям нашего формата имён, по возрастанию."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t ORDER BY c.relname"
+    ), {"t": PARENT}).scalars().all()
+
+    out = []
+    for name in names:
+        try:
+            y, m = name[len(PARENT) + 1:].split("_")
+            start = date(int(y), int(m), 1)
+        except ValueError:
+            continue                      # чужая секция — не трогаем
+        out.append((name, start, _add_months(start, 1)))
+    return out
+
+
+# ---------------------------------------------------------------------
+# maintenance
+# ---------------------------------------------------------------------
+def ensure_partitions(conn, start: Optional[date] = None, ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Создаём недостающие секции с месяца `start` (по умолчанию текущего)
+    по текущий + `ahead`. Возвращаем число созданных.
+    """
+    if not is_partitioned(conn):
+        log.warning("%s не секционирована — выполните "
+                    "`python -m backend.app.partitions migrate`", PARENT)
+        return 0
+
+    existing = {name for name, _, _ in list_partitions(conn)}
+    month    = _month_start(start or datetime.utcnow().date())
+    last     = _add_months(_month_start(datetime.utcnow().date()), ahead)
+    created  = 0
+    while month <= last:
+        name = _name(month)
+        if name not in existing:
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{PARENT}" '
+                f"FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')"
+            ))
+            created += 1
+        month = _add_months(month, 1)
+    return created
+
+
+def drop_expired(db: Session, cutoff: datetime) -> int:
+    """
+    Секции, целиком лежащие раньше cutoff, сворачиваем в material_snapshots
+    и отсоединяем+удаляем. Каждая секция — своя транзакция. Возвращаем число секций.
+    """
+    conn = db.connection()
+    if not is_partitioned(conn):
+        return 0
+
+    dropped = 0
+    for name, start, end in list_partitions(conn):
+        if datetime(end.year, end.month, end.day) > cutoff:
+            break
+        rows = db.execute(text(
+            f'SELECT material_id, SUM(qty) FROM "{name}" GROUP BY material_id'
+        )).all()
+        crud._fold_into_snapshots(db, {mid: qty for mid, qty in rows},
+                                  datetime(end.year, end.month, end.day))
+        db.execute(text(
+            f'UPDATE orders SET compacted = true WHERE NOT compacted AND id IN '
+            f'(SELECT DISTINCT order_id FROM "{name}" WHERE order_id IS NOT NULL)'
+        ))
+        db.execute(text(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{name}"'))
+        db.execute(text(f'DROP TABLE "{name}"'))
+        db.commit()
+        dropped += 1
+        log.info("Секция %s свёрнута и удалена", name)
+    return dropped
+
+
+# ---------------------------------------------------------------------
+# migration: обычная таблица → секционированная
+# ---------------------------------------------------------------------
+def migrate() -> None:
+    """
+    Одной транзакцией переносим данные из обычной stock_movements
+    в секционированную: переименовываем старую, создаём новую по модели,
+    заводим секции на весь диапазон данных, копируем строки, двигаем sequence.
+    """
+    if not STOCK_PARTITIONING:
+        raise SystemExit("Установите STOCK_PARTITIONING=1 — модель строит таблицу по этому флагу")
+
+    heap = f"{PARENT}_heap"
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            log.info("%s уже секционирована", PARENT)
+            return
+
+        conn.execute(text(f'LOCK TABLE "{PARENT}" IN ACCESS EXCLUSIVE MODE'))
+        conn.execute(text(f'ALTER TABLE "{PARENT}" RENAME TO "{heap}"'))
+        conn.execute(text(f'ALTER TABLE "{heap}" RENAME CONSTRAINT "{PARENT}_pkey" TO "{heap}_pkey"'))
+        conn.execute(text(f'ALTER SEQUENCE "{PARENT}_id_seq" RENAME TO "{heap}_id_seq"'))
+        for ix in models.StockMovement.__table__.indexes:     # имена индексов нужны новой таблице
+            conn.execute(text(f'ALTER INDEX IF EXISTS "{ix.name}" RENAME TO "{ix.name}_heap"'))
+
+        models.StockMovement.__table__.create(conn)
+
+        first = conn.execute(text(f'SELECT MIN(created_at) FROM "{heap}"')).scalar()
+        ensure_partitions(conn, start=first.date() if first else None)
+
+        moved = conn.execute(text(
+            f'INSERT INTO "{PARENT}" (id, material_id, order_id, qty, created_at) '
+            f'SELECT id, material_id, order_id, qty, created_at FROM "{heap}"'
+        )).rowcount
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{PARENT}', 'id'), "
+            f'COALESCE((SELECT MAX(id) FROM "{PARENT}"), 0) + 1, false)'
+        ))
+        conn.execute(text(f'DROP TABLE "{heap}"'))
+    log.info("Перенесено %s движений в секционированную %s", moved, PARENT)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "ensure"
+    if cmd == "migrate":
+        migrate()
+    elif cmd == "ensure":
+        with engine.begin() as conn:
+            log.info("Создано секций: %s", ensure_partitions(conn))
+    else:
+        raise SystemExit(f"неизвестная команда: {cmd}")
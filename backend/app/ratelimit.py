@@ -0,0 +1,253 @@
+"""
+Rate-limit запросов API (slowapi) с общими счётчиками для всех процессов.
+
+    RATELIMIT_STORAGE — где живут счётчики:
+        pg://       — таблица rate_limits в нашей PostgreSQL (по умолчанию);
+                      лимиты общие для всех процессов API и переживают рестарт
+        memory://   — в памяти процесса (локальный запуск, стенды)
+    RATELIMIT_ENABLED=0 — выключить
+    RATELIMIT_SYNC    — раз в сколько секунд сверяться с rate_limits (1 с)
+
+Ключ — пользователь из JWT (sub), без токена — IP. Сборщики за одним NAT склада
+так не делят один счётчик. Лимиты:
+
+    DEFAULT_LIMIT — все маршруты без своего лимита (100/minute)
+    LOGIN_LIMIT   — POST /auth/login, по IP: подбор пароля (10/minute)
+    READ_LIMIT    — частые чтения: остатки, плёнки, история (600/minute)
+
+slowapi зовёт хранилище синхронно, прямо в event loop. Поэтому pg:// на запросе
+в базу не ходит: окна считаются в памяти процесса, а фоновая задача (start())
+раз в RATELIMIT_SYNC секунд через run_db отправляет накопленные дельты в
+rate_limits и забирает общие суммы. Лимит общий с точностью до одной сверки;
+недоступная PostgreSQL лишь откладывает сверку.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from limits.storage import Storage
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from sqlalchemy import create_engine, text
+from starlette.requests import Request
+
+from backend.app.database import DATABASE_URL, run_db
+from backend.app.security import LIVE_SCOPE, token_claims
+
+log = logging.getLogger("ratelimit")
+
+RATELIMIT_STORAGE = os.getenv("RATELIMIT_STORAGE", "pg://")
+RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "1") == "1"
+DEFAULT_LIMIT     = os.getenv("DEFAULT_LIMIT", "100/minute")
+LOGIN_LIMIT       = os.getenv("LOGIN_LIMIT", "10/minute")
+READ_LIMIT        = os.getenv("READ_LIMIT", "600/minute")
+RATELIMIT_SYNC    = float(os.getenv("RATELIMIT_SYNC", "1"))
+PURGE_EVERY       = 60            # раз в столько секунд — удалить истёкшие окна
+
+
+# ─────── Ключи ───────
+def user_or_ip(request: Request) -> str:
+    """
+    sub из Bearer-токена; без заголовка — из ?token= (EventSource), но только
+    токена потока (scope=live). Нет или невалиден — адрес клиента.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    scope = None
+    if scheme.lower() != "bearer":
+        token, scope = request.query_params.get("token", ""), LIVE_SCOPE
+    payload = token_claims(token, scope) if token else None
+    if payload is not None:
+        return f"user:{payload['sub']}"
+    return f"ip:{get_remote_address(request)}"
+
+
+def client_ip(request: Request) -> str:
+    return f"ip:{get_remote_address(request)}"
+
+
+# ─────── Хранилище в PostgreSQL ───────
+# время — по часам PostgreSQL, чтобы окна совпадали у процессов на разных машинах
+_NOW = "extract(epoch FROM clock_timestamp())::float8"
+
+# дельты всех активных окон — одним UPSERT; нулевая дельта просто читает сумму
+_FLUSH = text(f"""
+    INSERT INTO rate_limits AS r (key, count, expires_at)
+    SELECT k, d, {_NOW} + e
+      FROM unnest(CAST(:keys AS text[]), CAST(:deltas AS int[]), CAST(:expiries AS float8[])) AS t(k, d, e)
+    ON CONFLICT (key) DO UPDATE SET
+        count      = CASE WHEN r.expires_at <= {_NOW} THEN excluded.count ELSE r.count + excluded.count END,
+        expires_at = CASE WHEN r.expires_at <= {_NOW} THEN excluded.expires_at ELSE r.expires_at END
+    RETURNING key, count, expires_at - {_NOW}
+""")
+_PURGE  = text(f"DELETE FROM rate_limits WHERE expires_at <= {_NOW}")
+
+
+class _Window:
+    __slots__ = ("expiry", "expires_at", "local", "pending", "remote")
+
+    def __init__(self, expiry: int, now: float):
+        self.expiry     = expiry
+        self.expires_at = now + expiry  # по time.monotonic
+        self.local      = 0             # запросы этого процесса в окне
+        self.pending    = 0             # из них ещё не отправлены в rate_limits
+        self.remote     = 0             # остальные процессы — по последней сверке
+
+
+class PostgresStorage(Storage):
+    """
+    Хранилище limits для стратегии fixed-window. incr/get — только память процесса
+    под threading.Lock; база — в flush() из фоновой задачи. Свой пул в AUTOCOMMIT:
+    без BEGIN/COMMIT на сверку и без конкуренции с сессиями обработчиков.
+    """
+    STORAGE_SCHEME = ["pg"]
+
+    def __init__(self, uri=None, **options):
+        super().__init__(uri, **options)
+        self.engine = create_engine(
+            DATABASE_URL,
+            isolation_level="AUTOCOMMIT",
+            pool_size=1,
+            pool_reset_on_return=None,
+            future=True,
+        )
+        self._windows: Dict[str, _Window] = {}
+        self._lock = threading.Lock()
+        self._purged = time.monotonic()
+        _storages.append(self)
+
+    def _scalar(self, stmt, **params):
+        with self.engine.connect() as conn:
+            res = conn.execute(stmt, params)
+            return res.scalar() if res.returns_rows else None
+
+    def _window(self, key: str) -> Optional[_Window]:
+        w = self._windows.get(key)
+        if w is not None and w.expires_at <= time.monotonic():
+            del self._windows[key]
+            return None
+        return w
+
+    # ——— путь запроса: без ввода-вывода ———
+    def incr(self, key, expiry, elastic_expiry=False):
+        with self._lock:
+            w = self._window(key)
+            if w is None:
+                w = self._windows[key] = _Window(expiry, time.monotonic())
+            elif elastic_expiry:
+                w.expires_at = time.monotonic() + expiry
+            w.local += 1
+            w.pending += 1
+            return w.remote + w.local
+
+    def get(self, key):
+        with self._lock:
+            w = self._window(key)
+            return w.remote + w.local if w else 0
+
+    def get_expiry(self, key):
+        with self._lock:
+            w = self._window(key)
+            return time.time() + (w.expires_at - time.monotonic() if w else 0)
+
+    # ——— фоновая сверка ———
+    def flush(self) -> None:
+        """Отправить дельты активных окон и забрать общие суммы. Блокирует — через run_db."""
+        with self._lock:
+            now = time.monotonic()
+            for key in [k for k, w in self._windows.items() if w.expires_at <= now]:
+                del self._windows[key]
+            batch = list(self._windows.items())
+            deltas = [w.pending for _, w in batch]
+            for _, w in batch:
+                w.pending = 0
+        if batch:
+            try:
+                with self.engine.connect() as conn:
+                    rows = conn.execute(_FLUSH, {
+                        "keys":     [k for k, _ in batch],
+                        "deltas":   deltas,
+                        "expiries": [float(w.expiry) for _, w in batch],
+                    }).all()
+            except Exception:
+                log.exception("Не удалось сверить счётчики rate-limit")
+                with self._lock:                    # дельты уйдут со следующей сверкой
+                    for (key, w), d in zip(batch, deltas):
+                        if self._windows.get(key) is w:
+                            w.pending += d
+                return
+            with self._lock:
+                now = time.monotonic()
+                for key, count, ttl in rows:
+                    w = self._windows.get(key)
+                    if w is None or ttl <= 0:
+                        continue
+                    # в count — все процессы, включая уже отправленное нами (local - pending)
+                    w.remote = max(0, count - (w.local - w.pending))
+                    w.expires_at = now + ttl        # окно — по часам PostgreSQL, общее для всех
+        if time.monotonic() - self._purged >= PURGE_EVERY:
+            self._purged = time.monotonic()
+            self.purge()
+
+    def check(self):
+        try:
+            return self._scalar(text("SELECT 1")) == 1
+        except Exception:
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._windows.clear()
+        self._scalar(text("DELETE FROM rate_limits"))
+
+    def clear(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+        self._scalar(text("DELETE FROM rate_limits WHERE key = :key"), key=key)
+
+    def purge(self) -> None:
+        try:
+            self._scalar(_PURGE)
+        except Exception:
+            log.exception("Не удалось удалить истёкшие счётчики rate-limit")
+
+
+_storages: List[PostgresStorage] = []
+_task: Optional[asyncio.Task] = None
+
+
+async def _sync() -> None:
+    while True:
+        await asyncio.sleep(RATELIMIT_SYNC)
+        for storage in _storages:
+            await run_db(storage.flush)
+
+
+def start() -> None:
+    """Фоновая сверка счётчиков pg:// (startup приложения API)."""
+    global _task
+    if not _storages or (_task and not _task.done()):
+        return
+    _task = asyncio.create_task(_sync())
+
+
+async def stop() -> None:
+    """Остановить сверку и отправить последние дельты."""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    for storage in _storages:
+        await run_db(storage.flush)
+
+
+limiter = Limiter(
+    key_func=user_or_ip,
+    default_limits=[DEFAULT_LIMIT],
+    storage_uri=RATELIMIT_STORAGE,
+    strategy="fixed-window",
+    in_memory_fallback_enabled=True,
+    enabled=RATELIMIT_ENABLED,
+)
@@ -0,0 +1,188 @@
+"""
+Версии ресурсов для условных GET (ETag / Last-Modified).
+
+Каждая запись, меняющая ответ, вызывает bump(db, <ресурс>) в своей транзакции.
+Счётчик в resource_versions растёт на 1 уже в commit (before_commit) — строка
+ресурса горячая, её лок держим только на сам commit и берём последним, после
+локов записи. После commit новая версия попадает в память этого процесса
+и через NOTIFY — в остальные. GET сравнивает
+If-None-Match с версией из памяти и отвечает 304, не открывая сессию.
+
+    MATERIALS — материалы, движения, балансы: /materials/, /materials/stock
+    FILMS     — склад готовых плёнок:          /films/
+
+RESOURCE_VERSION_TTL — сколько доверять версии в памяти; с NOTIFY это лишь
+страховка (час), без него (PG_NOTIFY=0) — 5 с.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from backend.app import models, notify
+from backend.app.database import SessionLocal, run_db
+
+MATERIALS = "materials"
+FILMS     = "films"
+NAMES     = (MATERIALS, FILMS)
+
+CHANNEL     = "resource_versions"
+VERSION_TTL = float(os.getenv("RESOURCE_VERSION_TTL", "3600" if notify.PG_NOTIFY else "5"))
+
+_BUMPS   = "resource_bumps"         # ключ в Session.info: ресурсы, изменённые в транзакции
+_PENDING = "resource_versions"      # … и их новые версии между before_commit и after_commit
+_EPOCH   = datetime(1970, 1, 1)
+
+
+@dataclass(frozen=True)
+class Validator:
+    name:       str
+    version:    int
+    updated_at: datetime
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self.name}-{self.version}"'
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag":          self.etag,
+            "Last-Modified": format_datetime(self.updated_at.replace(tzinfo=timezone.utc), usegmt=True),
+            # браузер не берёт ответ из кеша без проверки: данные меняются в любой момент
+            "Cache-Control": "private, no-cache",
+        }
+
+
+class Versions:
+    """
+    Копия resource_versions в памяти процесса. listen(cb) — cb(name) при новой
+    версии, cb(None) — когда копию сбросили и изменения могли потеряться.
+    Вызывается в потоке записавшего (after_commit) или в event loop (NOTIFY).
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items: Dict[str, Tuple[float, int, datetime]] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+
+    def listen(self, callback: Callable[[Optional[str]], None]) -> None:
+        self._listeners.append(callback)
+
+    def _changed(self, name: Optional[str]) -> None:
+        for cb in self._listeners:
+            cb(name)
+
+    def get(self, name: str) -> Optional[Validator]:
+        item = self._items.get(name)
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            return None
+        return Validator(name, item[1], item[2])
+
+    def put(self, name: str, version: int, updated_at: datetime) -> None:
+        # версии только растут: запоздавший SELECT или NOTIFY не откатит свежую
+        with self._lock:
+            item = self._items.get(name)
+            if item is not None and version < item[1]:
+                return
+            self._items[name] = (time.monotonic(), version, updated_at)
+        if item is None or version > item[1]:
+            self._changed(name)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._items.clear()
+        self._changed(None)
+
+    def on_notify(self, payload: Optional[str]) -> None:
+        if payload is None:             # слушатель переподключился — сигналы могли потеряться
+            self.reset()
+            return
+        name, version, updated_at = payload.split(" ", 2)
+        self.put(name, int(version), datetime.fromisoformat(updated_at))
+
+
+versions = Versions(VERSION_TTL)
+notify.subscribe(CHANNEL, versions.on_notify)
+
+
+# ─────── Запись ───────
+def bump(db: Session, name: str) -> None:
+    """Ресурс меняется в транзакции вызывающего; новая версия — в его commit."""
+    db.connection()                     # начать транзакцию: её rollback сбросит и отметку
+    db.info.setdefault(_BUMPS, set()).add(name)     # одна транзакция — одна версия
+
+
+@event.listens_for(Session, "before_commit")
+def _committing(session: Session) -> None:
+    names = session.info.pop(_BUMPS, None)
+    if not names:
+        return
+    session.flush()                     # локи записи — раньше лока строки версии
+    rv = models.ResourceVersion
+    pending = session.info.setdefault(_PENDING, {})
+    for name in sorted(names):          # один порядок локов во всех транзакциях
+        stmt = pg_insert(rv).values(name=name, version=1, updated_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[rv.name],
+            set_={"version": rv.version + 1, "updated_at": stmt.excluded.updated_at},
+        ).returning(rv.version, rv.updated_at)
+        version, updated_at = session.execute(stmt).one()
+        pending[name] = (version, updated_at)
+        notify.publish(session, CHANNEL, f"{name} {version} {updated_at.isoformat()}")
+
+
+@event.listens_for(Session, "after_commit")
+def _committed(session: Session) -> None:
+    for name, (version, updated_at) in session.info.pop(_PENDING, {}).items():
+        versions.put(name, version, updated_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def _rolled_back(session: Session) -> None:
+    session.info.pop(_BUMPS, None)
+    session.info.pop(_PENDING, None)
+
+
+# ─────── Условный GET ───────
+def _load() -> None:
+    with SessionLocal() as db:
+        found = {r.name: r for r in db.query(models.ResourceVersion)}
+    for name in NAMES:
+        r = found.get(name)
+        versions.put(name, r.version if r else 0, r.updated_at if r else _EPOCH)
+
+
+async def validator(name: str) -> Validator:
+    """Версия из памяти; в базу — только при холодном старте или по истечении TTL."""
+    v = versions.get(name)
+    if v is None:
+        await run_db(_load)
+        v = versions.get(name) or Validator(name, 0, _EPOCH)
+    return v
+
+
+def fresh(request: Request, v: Validator) -> bool:
+    """If-None-Match совпал с текущей версией (слабое сравнение)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return "*" in tags or v.etag.removeprefix("W/") in tags
+
+
+def not_modified(v: Validator) -> Response:
+    return Response(status_code=304, headers=v.headers)
+
+
+def stamp(response: Response, v: Validator) -> None:
+    response.headers.update(v.headers)
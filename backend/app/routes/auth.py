@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 
-from ..database import get_db
+from ..database import get_session, run
 from ..models import Role, User
-from ..security import verify_password, create_access_token, get_current_user
+from ..security import CurrentUser, create_access_token, get_current_user, active_user
+from ..ratelimit import limiter, client_ip, LOGIN_LIMIT
+from .. import hashing
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -17,21 +19,32 @@ class TokenOut(BaseModel):
 
 
 @router.post("/login", response_model=TokenOut)
-def login(
+@limiter.limit(LOGIN_LIMIT, key_func=client_ip)
+async def login(
+    request: Request,
     form: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
-    user: User | None = (
-        db.query(User).filter(User.username == form.username, User.is_active).first()
-    )
-    if not user or not verify_password(form.password, user.hashed_password):
+    user: User | None = await run(db, active_user, form.username)
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    ok, new_hash = await hashing.verify_password(form.password, user.hashed_password)
+    if not ok:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if new_hash:
+        # стоимость хеша отличается от BCRYPT_ROUNDS — пересохраняем
+        await run(db, _store_hash, user.id, new_hash)
     return TokenOut(access_token=create_access_token(user.username))
 
+
+def _store_hash(db: Session, user_id, hashed: str) -> None:
+    db.query(User).filter(User.id == user_id).update({User.hashed_password: hashed})
+    db.commit()
+
 class MeOut(BaseModel):
     username: str
     role:     Role
 
 @router.get("/me", response_model=MeOut)
-def me(user: User = Depends(get_current_user)):
+def me(user: CurrentUser = Depends(get_current_user)):
     return {"username": user.username, "role": user.role}
\ No newline at end of file
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
-from ..database import get_db
+from ..database import get_session, run
 from ..models   import ReadyFilm
 from ..schemas  import FilmOut
 from ..security import get_current_user
+from ..ratelimit import limiter, READ_LIMIT
+from .. import resources
 
 router = APIRouter(prefix="/films", tags=["films"])
 
 @router.get("/", response_model=list[FilmOut],
             dependencies=[Depends(get_current_user)])
-def list_films(db: Session = Depends(get_db)):
+@limiter.limit(READ_LIMIT)
+async def list_films(request: Request, response: Response, db: Session = Depends(get_session)):
+    # версия — до чтения данных: ETag не бывает новее тела
+    v = await resources.validator(resources.FILMS)
+    if resources.fresh(request, v):
+        return resources.not_modified(v)
+    resources.stamp(response, v)
+    return await run(db, _films)
+
+
+def _films(db: Session) -> list[ReadyFilm]:
     # ORDER BY для стабильного вывода
     return db.query(ReadyFilm).order_by(ReadyFilm.title).all()
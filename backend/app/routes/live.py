@@ -0,0 +1,46 @@
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from ..database import get_session
+from ..live import broadcaster
+from ..security import (LIVE_SCOPE, LIVE_TTL, CurrentUser, create_live_token,
+                        get_current_user, oauth2_scheme, token_claims, user_from_token)
+
+router = APIRouter(prefix="/live", tags=["live"])
+
+
+class LiveTokenOut(BaseModel):
+    token:      str
+    expires_in: int
+
+
+@router.post("/token", response_model=LiveTokenOut)
+async def live_token(
+    user: CurrentUser = Depends(get_current_user),
+    token: str = Depends(oauth2_scheme),
+):
+    """Короткий токен только для потока: основной в URL EventSource не кладём."""
+    until = token_claims(token)["exp"]
+    return LiveTokenOut(token=create_live_token(user.username, until),
+                        expires_in=int(LIVE_TTL.total_seconds()))
+
+
+@router.get("/")
+async def live(token: str = Query(...)):
+    """
+    Поток SSE для сборщиков: остатки и готовые плёнки (см. backend/app/live.py).
+    EventSource не умеет заголовки — в строке запроса токен из POST /live/token
+    (scope=live, LIVE_TTL); обычный токен доступа здесь не принимается.
+    """
+    # сессия — только на проверку токена: поток живёт часами и соединение не держит
+    async with asynccontextmanager(get_session)() as db:
+        await user_from_token(token, db, LIVE_SCOPE)
+    until = token_claims(token, LIVE_SCOPE).get("until")
+    return StreamingResponse(
+        broadcaster.stream(until),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 
-from ..database import get_db
+from ..database import get_session, run
 from ..security import get_current_user, admin_required
-from .. import crud, models, schemas
+from ..ratelimit import limiter, READ_LIMIT
+from .. import crud, models, outbox, resources, schemas
 
 router = APIRouter(prefix="/materials", tags=["Материалы"])
 
@@ -29,8 +30,12 @@ class MaterialHistory(BaseModel):
     response_model=List[schemas.Material],
     dependencies=[Depends(admin_required)]
 )
-def all_materials(db: Session = Depends(get_db)):
-    return crud.list_materials(db)
+async def all_materials(request: Request, response: Response, db: Session = Depends(get_session)):
+    v = await resources.validator(resources.MATERIALS)
+    if resources.fresh(request, v):
+        return resources.not_modified(v)
+    resources.stamp(response, v)
+    return await run(db, crud.list_materials)
 
 
 @router.post(
@@ -38,8 +43,8 @@ def all_materials(db: Session = Depends(get_db)):
     response_model=schemas.Material,
     dependencies=[Depends(admin_required)]
 )
-def create(mat: schemas.MaterialCreate, db: Session = Depends(get_db)):
-    return crud.create_or_add_material(db, mat)
+async def create(mat: schemas.MaterialCreate, db: Session = Depends(get_session)):
+    return await run(db, crud.create_or_add_material, mat)
 
 
 @router.put(
@@ -47,8 +52,8 @@ def create(mat: schemas.MaterialCreate, db: Session = Depends(get_db)):
     response_model=schemas.Material,
     dependencies=[Depends(admin_required)]
 )
-def update(mid: int, mat: schemas.MaterialCreate, db: Session = Depends(get_db)):
-    obj = crud.update_material(db, mid, mat)
+async def update(mid: int, mat: schemas.MaterialCreate, db: Session = Depends(get_session)):
+    obj = await run(db, crud.update_material, mid, mat)
     if not obj:
         raise HTTPException(404, "Материал не найден")
     return obj
@@ -58,8 +63,8 @@ def update(mid: int, mat: schemas.MaterialCreate, db: Session = Depends(get_db))
     "/{mid}",
     dependencies=[Depends(admin_required)]
 )
-def delete(mid: int, db: Session = Depends(get_db)):
-    crud.delete_material(db, mid)
+async def delete(mid: int, db: Session = Depends(get_session)):
+    await run(db, crud.delete_material, mid)
     return {"ok": True}
 
 
@@ -67,18 +72,45 @@ def delete(mid: int, db: Session = Depends(get_db)):
     "/{mid}/min",
     dependencies=[Depends(admin_required)]
 )
-def set_min(mid: int, value: float, db: Session = Depends(get_db)):
-    crud.update_min_qty(db, mid, value)
+async def set_min(mid: int, value: float, db: Session = Depends(get_session)):
+    await run(db, crud.update_min_qty, mid, value)
+    outbox.wakeup.set()
     return {"ok": True}
 
 
+@router.get(
+    "/balances/check",
+    dependencies=[Depends(admin_required)]
+)
+async def check_balances(db: Session = Depends(get_session)):
+    """Сверка material_balances с журналом движений, без изменений."""
+    drift = await run(db, crud.check_balances)
+    return {"ok": not drift, "fixed": False, "drift": drift}
+
+
+@router.post(
+    "/balances/rebuild",
+    dependencies=[Depends(admin_required)]
+)
+async def rebuild_balances(db: Session = Depends(get_session)):
+    """Та же сверка, но расходящиеся балансы перестраиваются по журналу."""
+    drift = await run(db, crud.check_balances, fix=True)
+    return {"ok": not drift, "fixed": bool(drift), "drift": drift}
+
+
 # ---------- Остатки / история (any role) ----------
 @router.get(
     "/stock",
     dependencies=[Depends(get_current_user)]
 )
-def stock(db: Session = Depends(get_db)):
-    return crud.stock_materials(db)
+@limiter.limit(READ_LIMIT)
+async def stock(request: Request, response: Response, db: Session = Depends(get_session)):
+    # версия — до чтения данных: ETag не бывает новее тела
+    v = await resources.validator(resources.MATERIALS)
+    if resources.fresh(request, v):
+        return resources.not_modified(v)
+    resources.stamp(response, v)
+    return await run(db, crud.stock_materials)
 
 
 @router.get(
@@ -86,10 +118,12 @@ def stock(db: Session = Depends(get_db)):
     response_model=List[MaterialHistory],
     dependencies=[Depends(get_current_user)]
 )
-def history(
+@limiter.limit(READ_LIMIT)
+async def history(
+    request: Request,
     mid: int,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     """
     Возвращает до `limit` последних движений по материалу mid:
@@ -98,6 +132,10 @@ def history(
     • qty          — изменение (может быть ±)
     • dt           — время движения
     """
+    return await run(db, _history, mid, limit)
+
+
+def _history(db: Session, mid: int, limit: int) -> List[MaterialHistory]:
     # джоин на orders, чтобы получить order.number
     q = (
         db.query(
@@ -128,8 +166,8 @@ def history(
     "/{mid}/adjust",
     dependencies=[Depends(get_current_user)]
 )
-def adjust(mid: int, delta: float, db: Session = Depends(get_db)):
-    crud.add_adjustment(db, mid, delta)
+async def adjust(mid: int, delta: float, db: Session = Depends(get_session)):
+    await run(db, crud.add_adjustment, mid, delta)
     return {"ok": True}
 
 
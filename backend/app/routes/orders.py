@@ -1,17 +1,22 @@
 # backend/app/routes/orders.py
+import asyncio
+import logging
 
 from fastapi import APIRouter, Depends, status
 from sqlalchemy.orm import Session
 
-from ..database import get_db
+from ..database import get_session, run, SessionLocal
 from ..security import admin_required
-from .. import crud, schemas
+from .. import crud, schemas, sync
 from ..services.insales import fetch_orders
 
 from httpx import HTTPError, ConnectTimeout, ReadTimeout
 from fastapi import HTTPException
 
 router = APIRouter(prefix="/orders", tags=["orders"])
+log = logging.getLogger("orders")
+
+_backfill: asyncio.Task | None = None
 
 
 @router.get(
@@ -19,11 +24,16 @@ router = APIRouter(prefix="/orders", tags=["orders"])
     response_model=list[schemas.OrderOut],
     dependencies=[Depends(admin_required)]
 )
-def read_orders(db: Session = Depends(get_db)):
+async def read_orders(db: Session = Depends(get_session)):
     """
     Список всех заказов (только для админа).
     """
-    return crud.list_orders(db)
+    return await run(db, _orders)
+
+
+def _orders(db: Session) -> list[schemas.OrderOut]:
+    # строки заказов — связь: собираем схемы, пока сессия может их догрузить
+    return [schemas.OrderOut.model_validate(o) for o in crud.list_orders(db)]
 
 
 @router.post(
@@ -31,11 +41,15 @@ def read_orders(db: Session = Depends(get_db)):
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(admin_required)]
 )
-async def import_orders(db: Session = Depends(get_db)):
+async def import_orders(full: bool = False, db: Session = Depends(get_session)):
     """
     Ручной импорт заказов кнопкой.
     502 — если InSales недоступен / таймаут.
+    full=true — фоновый импорт всей истории заказов.
     """
+    if full:
+        return {"started": _start_backfill()}
+
     try:
         orders = await fetch_orders(50)
     except (ConnectTimeout, ReadTimeout):
@@ -44,20 +58,38 @@ async def import_orders(db: Session = Depends(get_db)):
         raise HTTPException(status_code=502, detail=f"InSales error: {exc!s}")
 
     for o in orders:
-        crud.upsert_order(db, o)
+        await run(db, crud.upsert_order, o)
 
     return {"imported": len(orders)}
 
 
+def _start_backfill() -> bool:
+    """Запускаем импорт истории, если он ещё не идёт."""
+    global _backfill
+    if _backfill and not _backfill.done():
+        return False
+
+    async def run() -> None:
+        with SessionLocal() as db:
+            try:
+                n = await sync.backfill_orders(db)
+                log.info("Импорт истории завершён: %s заказов", n)
+            except Exception:
+                log.exception("Импорт истории упал")
+
+    _backfill = asyncio.create_task(run())
+    return True
+
+
 @router.delete(
     "/{order_id}",
     dependencies=[Depends(admin_required)]
 )
-def ignore_order(order_id: int, db: Session = Depends(get_db)):
+async def ignore_order(order_id: int, db: Session = Depends(get_session)):
     """
     DELETE → помечаем заказ ignored=True, списываем материалы.
     """
-    crud.ignore_order(db, order_id, True)
+    await run(db, crud.ignore_order, order_id, True)
     return {"ok": True}
 
 
@@ -65,9 +97,9 @@ def ignore_order(order_id: int, db: Session = Depends(get_db)):
     "/{order_id}/enable",
     dependencies=[Depends(admin_required)]
 )
-def enable_order(order_id: int, db: Session = Depends(get_db)):
+async def enable_order(order_id: int, db: Session = Depends(get_session)):
     """
     PATCH → снимаем флаг ignored, возвращаем материалы.
     """
-    crud.ignore_order(db, order_id, False)
+    await run(db, crud.ignore_order, order_id, False)
     return {"ok": True}
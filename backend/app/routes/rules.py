@@ -1,29 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import Union
-from backend.app.database import get_db
+from backend.app.database import get_session, run, SessionLocal
 from backend.app import crud, schemas
 
+log = logging.getLogger("rules")
+
 router = APIRouter(prefix="/rules", tags=["Правила"])
 
 
 @router.get("/", response_model=list[schemas.MaterialRule])
-def get_rules(db: Session = Depends(get_db)):
-    return crud.list_rules(db)
+async def get_rules(db: Session = Depends(get_session)):
+    return await run(db, _rules)
+
+
+def _rules(db: Session) -> list[schemas.MaterialRule]:
+    # material — связь: схемы собираем внутри сессии
+    return [schemas.MaterialRule.model_validate(r) for r in crud.list_rules(db)]
 
 
 @router.post("/", response_model=list[schemas.MaterialRule])
-def create_rule(payload: Union[schemas.MaterialRuleCreate,
-                               list[schemas.MaterialRuleCreate]],
-                db: Session = Depends(get_db)):
+async def create_rule(payload: Union[schemas.MaterialRuleCreate,
+                                     list[schemas.MaterialRuleCreate]],
+                      db: Session = Depends(get_session)):
     items = payload if isinstance(payload, list) else [payload]
     items = [i for i in items if i.material_id]      # убираем пустые связанные
     if not items:
         raise HTTPException(400, "Нет валидных правил")
-    return [crud.create_rule(db, r) for r in items]
+    return await run(db, _create_rules, items)
+
+
+def _create_rules(db: Session, items: list[schemas.MaterialRuleCreate]) -> list[schemas.MaterialRule]:
+    return [schemas.MaterialRule.model_validate(crud.create_rule(db, r)) for r in items]
 
 
 @router.delete("/{rid}")
-def delete_rule(rid: int, db: Session = Depends(get_db)):
-    crud.delete_rule(db, rid)
+async def delete_rule(rid: int, db: Session = Depends(get_session)):
+    await run(db, crud.delete_rule, rid)
     return {"ok": True}
+
+
+# ---------- Пересчёт движений всех заказов по текущим правилам ----------
+
+def _run_backfill(resume: bool) -> None:
+    def progress(done: int, total: int) -> None:
+        log.info("Пересчёт правил: %s / %s заказов", done, total)
+
+    with SessionLocal() as db:
+        try:
+            crud.reapply_rules(db, resume=resume, progress=progress)
+        except RuntimeError as exc:
+            log.warning("Пересчёт правил не запущен: %s", exc)
+        except Exception:
+            log.exception("Пересчёт правил упал")
+
+
+@router.post("/backfill", status_code=202)
+def start_backfill(background: BackgroundTasks, resume: bool = True):
+    """
+    Запускаем пересчёт движений всех заказов в фоне.
+    resume=false — начать заново, даже если прошлый пересчёт прерван.
+    """
+    background.add_task(_run_backfill, resume)
+    return {"started": True}
+
+
+@router.get("/backfill")
+async def backfill_status(db: Session = Depends(get_session)):
+    """Прогресс последнего пересчёта: done / total, курсор, finished."""
+    return await run(db, crud.backfill_status) or {}
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import date, datetime, timedelta
-from backend.app.database import get_db
-from backend.app import models
+from datetime import date, datetime, time, timedelta
+from backend.app.database import get_session, run
+from backend.app import hashing, http_clients, models
+from backend.app.live import broadcaster
+from backend.app.security import user_cache
 
 router = APIRouter(prefix="/stats", tags=["Статистика"])
 
@@ -17,14 +19,18 @@ def cutoff_date() -> date:
 
 
 @router.get("/totals")
-def totals(year: int | None = Query(None, ge=2000),
-           month: int | None = Query(None, ge=1, le=12),
-           db: Session = Depends(get_db)):
+async def totals(year: int | None = Query(None, ge=2000),
+                 month: int | None = Query(None, ge=1, le=12),
+                 db: Session = Depends(get_session)):
     """
     Чистый расход по каждому материалу.
     • Без параметров — за последние 12 месяцев.
     • c year & month — за указанный календарный месяц.
     """
+    return await run(db, _totals, year, month)
+
+
+def _totals(db: Session, year: int | None, month: int | None) -> dict:
     q = (db.query(models.Material.name,
                   func.sum(models.StockMovement.qty).label("sum_qty"))
             .join(models.StockMovement,
@@ -37,8 +43,9 @@ def totals(year: int | None = Query(None, ge=2000),
         start = cutoff_date()
         end   = datetime.utcnow().date() + timedelta(days=1)
 
-    q = q.filter(models.StockMovement.created_at >= start,
-                 models.StockMovement.created_at <  end)
+    # границы как timestamp — тогда планировщик отсекает лишние секции
+    q = q.filter(models.StockMovement.created_at >= datetime.combine(start, time()),
+                 models.StockMovement.created_at <  datetime.combine(end, time()))
 
     rows = (q.group_by(models.Material.name)
               .order_by(func.sum(models.StockMovement.qty)).all())
@@ -48,3 +55,27 @@ def totals(year: int | None = Query(None, ge=2000),
         spent = max(0, -sum_qty)        # чистый расход, не может быть < 0
         out[name] = spent
     return out
+
+
+@router.get("/http")
+def http_pools():
+    """Пулы HTTP-клиентов: запросы, новые TCP/TLS соединения, открытые/простаивающие."""
+    return http_clients.stats()
+
+
+@router.get("/auth-cache")
+def auth_cache():
+    """Кеш пользователей get_current_user: hits / misses / invalidations / size."""
+    return user_cache.info()
+
+
+@router.get("/hashing")
+def hashing_pool():
+    """Пул bcrypt: стоимость, потоки, очередь."""
+    return hashing.stats()
+
+
+@router.get("/live")
+def live_clients():
+    """Рассыльщик SSE этого процесса: подключённые клиенты и размеры снимков."""
+    return broadcaster.stats()
@@ -3,9 +3,10 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from uuid import UUID
 
-from ..database import get_db
+from ..database import get_session, run
 from ..models import User, Role
-from ..security import hash_password, admin_required
+from ..security import admin_required, user_cache, user_changed
+from .. import hashing
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -39,8 +40,8 @@ class PasswordChange(BaseModel):
     response_model=list[UserOut],
     dependencies=[Depends(admin_required)]
 )
-def list_users(db: Session = Depends(get_db)):
-    return db.query(User).all()
+async def list_users(db: Session = Depends(get_session)):
+    return await run(db, lambda s: s.query(User).all())
 
 
 @router.post(
@@ -49,12 +50,20 @@ def list_users(db: Session = Depends(get_db)):
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(admin_required)]
 )
-def create_user(data: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter_by(username=data.username).first():
+async def create_user(data: UserCreate, db: Session = Depends(get_session)):
+    hashed = await hashing.hash_password(data.password)
+    user = await run(db, _create_user, data, hashed)
+    if user is None:
         raise HTTPException(status_code=400, detail="Username already exists")
+    return user
+
+
+def _create_user(db: Session, data: UserCreate, hashed: str) -> User | None:
+    if db.query(User).filter_by(username=data.username).first():
+        return None
     user = User(
         username=data.username,
-        hashed_password=hash_password(data.password),
+        hashed_password=hashed,
         role=data.role,
     )
     db.add(user)
@@ -67,26 +76,22 @@ def create_user(data: UserCreate, db: Session = Depends(get_db)):
     "/{user_id}/state",
     dependencies=[Depends(admin_required)]
 )
-def toggle_active(user_id: UUID, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    user.is_active = not user.is_active
-    db.commit()
-    return {"ok": True, "is_active": user.is_active}
+async def toggle_active(user_id: UUID, db: Session = Depends(get_session)):
+    def flip(user: User) -> bool:
+        user.is_active = not user.is_active
+        return user.is_active
+    return {"ok": True, "is_active": await run(db, _update_user, user_id, flip)}
 
 
 @router.patch(
     "/{user_id}/role",
     dependencies=[Depends(admin_required)]
 )
-def change_role(user_id: UUID, role: Role, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    user.role = role
-    db.commit()
-    return {"ok": True, "role": user.role}
+async def change_role(user_id: UUID, role: Role, db: Session = Depends(get_session)):
+    def set_role(user: User) -> Role:
+        user.role = role
+        return role
+    return {"ok": True, "role": await run(db, _update_user, user_id, set_role)}
 
 
 @router.patch(
@@ -94,14 +99,25 @@ def change_role(user_id: UUID, role: Role, db: Session = Depends(get_db)):
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(admin_required)]
 )
-def change_password(
+async def change_password(
     user_id: UUID,
     body: PasswordChange,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
+    hashed = await hashing.hash_password(body.new_password)
+    def set_password(user: User) -> None:
+        user.hashed_password = hashed
+    await run(db, _update_user, user_id, set_password)
+    return {"ok": True}
+
+
+def _update_user(db: Session, user_id: UUID, change):
+    """Меняем пользователя в сессии; значение change(user) — для ответа (после commit объект истёк)."""
     user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user.hashed_password = hash_password(body.new_password)
+    result = change(user)
+    user_changed(db, user_id)           # сброс кеша в других процессах
     db.commit()
-    return {"ok": True}
+    user_cache.invalidate(str(user_id))
+    return result
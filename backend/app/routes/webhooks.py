@@ -0,0 +1,52 @@
+import os
+import hmac
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from ..database import get_session, run
+from ..ratelimit import limiter
+from .. import crud, sync
+from ..services import insales
+
+# секрет из URL вебхука в админке InSales: …/api/webhooks/insales/orders?token=<секрет>
+WEBHOOK_TOKEN = os.getenv("INSALES_WEBHOOK_TOKEN")
+
+# темы вебхуков InSales, которые мы подписываем на этот адрес
+TOPICS = {"orders/create", "orders/update"}
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+
+@router.post("/insales/orders")
+@limiter.exempt          # всплески InSales после массовых правок не режем; доступ — по секрету в URL
+async def insales_order(
+    request: Request,
+    token: str = "",
+    topic: str = "orders/update",
+    db: Session = Depends(get_session),
+):
+    """
+    Приём вебхука InSales orders/create | orders/update.
+    Проверяем секрет и структуру заказа, кладём событие в очередь и сразу отвечаем;
+    обработка — фоновым обработчиком (sync.consume_webhooks).
+    """
+    if not WEBHOOK_TOKEN or not hmac.compare_digest(token, WEBHOOK_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid webhook token")
+    if topic not in TOPICS:
+        raise HTTPException(status_code=422, detail=f"Unknown webhook topic: {topic}")
+
+    try:
+        payload = json.loads(await request.body())
+        if isinstance(payload, dict) and isinstance(payload.get("order"), dict):
+            payload = payload["order"]
+        insales.parse_orders([payload])             # валидация: те же поля, что у опроса
+        order_id = int(payload["id"])
+    except (ValueError, KeyError, TypeError, AttributeError, ValidationError) as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid order payload: {exc!s}")
+
+    await run(db, crud.enqueue_webhook, topic, order_id, json.dumps(payload, ensure_ascii=False))
+    sync.webhook_wakeup.set()
+    return {"ok": True}
@@ -81,6 +81,7 @@ class OrderOut(BaseModel):
     number:          str
     customer:        Optional[str]         = None
     created_at:      datetime
+    updated_at:      Optional[datetime]    = None
     ignored:         bool                  = False
     ready_notified:  bool                  = False
     client_notified: bool                  = False
@@ -98,6 +99,7 @@ class OrderOut(BaseModel):
 # ---------- READY FILMS ----------
 
 class FilmOut(BaseModel):
+    sku: str
     title: str
     quantity: int
 
@@ -1,37 +1,56 @@
 import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
+from uuid import UUID
 
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-from .database import get_db
+from .database import get_session, run
 from .models import User, Role
+from . import notify
 
 SECRET_KEY = os.getenv("SECRET_KEY", "CHANGEME_SUPER_SECRET")
 ALGORITHM  = "HS256"
 ACCESS_TTL = timedelta(hours=8)
+LIVE_TTL   = timedelta(seconds=60)  # токен потока SSE: только на его открытие
+LIVE_SCOPE = "live"
 
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-# ------------------------------------------------------------------ #
-# утилиты паролей
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_ctx.verify(plain, hashed)
-
-def hash_password(password: str) -> str:
-    return pwd_ctx.hash(password)
+# пароли — backend/app/hashing.py
 
 # ------------------------------------------------------------------ #
 # JWT
-def create_access_token(subject: str, ttl: timedelta = ACCESS_TTL) -> str:
+def create_access_token(subject: str, ttl: timedelta = ACCESS_TTL, **claims) -> str:
     now = datetime.utcnow()
-    payload = {"sub": subject, "iat": now, "exp": now + ttl}
+    payload = {"sub": subject, "iat": now, "exp": now + ttl, **claims}
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_live_token(subject: str, until: Optional[int]) -> str:
+    """
+    Токен для GET /api/live/: EventSource кладёт его в URL (логи прокси, история),
+    поэтому он живёт LIVE_TTL и годится только для потока. until — срок основного
+    токена: дольше него поток не живёт.
+    """
+    return create_access_token(subject, LIVE_TTL, scope=LIVE_SCOPE, until=until)
+
+def token_claims(token: str, scope: Optional[str] = None) -> Optional[dict]:
+    """Проверенные claims токена нужной области (None — обычный токен доступа)."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("scope") != scope or payload.get("sub") is None:
+        return None
+    return payload
+
 def _credentials_exc() -> HTTPException:
     return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -39,25 +58,115 @@ def _credentials_exc() -> HTTPException:
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+# ------------------------------------------------------------------ #
+# кеш активных пользователей
+# get_current_user — на каждом запросе; пользователь живёт в кеше USER_CACHE_TTL секунд.
+# Смена статуса/роли/пароля (routes/users.py) сбрасывает запись сразу, а в других
+# процессах — через NOTIFY (backend/app/notify.py).
+USER_CACHE_TTL     = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE    = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_CHANNEL = "user_cache"
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Снимок пользователя для зависимостей: без пароля и без привязки к сессии."""
+    id:       UUID
+    username: str
+    role:     Role
+
+class UserCache:
+    def __init__(self, ttl: float, size: int):
+        self.ttl, self.size = ttl, size
+        self._items: "OrderedDict[str, tuple[float, CurrentUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0            # растёт с каждым invalidate
+        self.stats = Counter()
+
+    @property
+    def generation(self) -> int:
+        """Снимите до чтения из БД и передайте в put: сброс между ними отменит запись."""
+        return self._generation
+
+    def get(self, username: str) -> Optional[CurrentUser]:
+        with self._lock:
+            item = self._items.get(username)
+            if item is None or item[0] < time.monotonic():
+                self._items.pop(username, None)
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(username)
+            self.stats["hits"] += 1
+            return item[1]
+
+    def put(self, user: User, generation: Optional[int] = None) -> CurrentUser:
+        snap = CurrentUser(id=user.id, username=user.username, role=user.role)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                # пока читали из БД, кеш сбросили — прочитанное могло устареть
+                self.stats["stale_puts"] += 1
+                return snap
+            self._items[snap.username] = (time.monotonic() + self.ttl, snap)
+            self._items.move_to_end(snap.username)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return snap
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Сбросить пользователя по id (строкой) или весь кеш (None)."""
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidations"] += 1
+            if user_id is None:
+                self._items.clear()
+                return
+            for name, (_, snap) in list(self._items.items()):
+                if str(snap.id) == user_id:
+                    del self._items[name]
+
+    def info(self) -> dict:
+        with self._lock:
+            return {**self.stats, "size": len(self._items), "ttl": self.ttl}
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+notify.subscribe(USER_CACHE_CHANNEL, lambda payload: user_cache.invalidate(payload or None))
+
+def user_changed(db: Session, user_id: UUID) -> None:
+    """
+    В транзакции изменения пользователя: NOTIFY остальным процессам уйдёт с commit.
+    Свой кеш сбрасывайте после commit (user_cache.invalidate). Запрос, прочитавший
+    пользователя до commit, может положить в кеш старое состояние уже после сброса —
+    это отсекает поколение кеша: get_current_user снимает его до чтения из БД,
+    а put не записывает, если между ними был invalidate.
+    """
+    notify.publish(db, USER_CACHE_CHANNEL, str(user_id))
+
 # ------------------------------------------------------------------ #
 # зависимости
-def get_current_user(
+def active_user(db: Session, username: str) -> User | None:
+    return db.query(User).filter(User.username == username, User.is_active).first()
+
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> User:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str | None = payload.get("sub")
-    except JWTError:
-        raise _credentials_exc()
-    if username is None:
+    db: Session = Depends(get_session),
+) -> CurrentUser:
+    return await user_from_token(token, db)
+
+async def user_from_token(token: str, db: Session, scope: Optional[str] = None) -> CurrentUser:
+    """Активный пользователь по токену области scope; токен другой области — 401."""
+    payload = token_claims(token, scope)
+    if payload is None:
         raise _credentials_exc()
-    user = db.query(User).filter(User.username == username, User.is_active).first()
+    username: str = payload["sub"]
+    cached = user_cache.get(username)
+    if cached is not None:
+        return cached
+    generation = user_cache.generation
+    user = await run(db, active_user, username)
     if user is None:
         raise _credentials_exc()
-    return user
+    return user_cache.put(user, generation)
 
-def admin_required(user: User = Depends(get_current_user)) -> User:
+async def admin_required(user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     if user.role != Role.admin:
         raise HTTPException(status_code=403, detail="Admin privileges required")
     return user
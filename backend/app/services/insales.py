@@ -1,9 +1,12 @@
 import os
+import time
 import datetime
 import httpx, asyncio
-from typing import List, Union
+from typing import AsyncIterator, List, Optional, Union
 
-from backend.app import schemas
+from pydantic import AliasPath, Field, TypeAdapter
+
+from backend.app import http_clients, schemas
 
 INSALES_API_KEY = os.getenv("INSALES_API_KEY")
 INSALES_API_PWD = os.getenv("INSALES_API_PWD")
@@ -15,67 +18,216 @@ TIMEOUT   = httpx.Timeout(  # ⬅️  все четыре параметра!
 )
 RETRIES   = 3         # сколько раз пробуем
 RETRY_PAUSE = 3       # секунд между попытками
+PER_PAGE  = 100       # максимум InSales на страницу
+DECODE_OFFLOAD_BYTES = 256 * 1024   # страницы крупнее декодируем вне event loop
 
-async def fetch_orders(limit: int = 50) -> list[schemas.OrderOut]:
+http_clients.register(
+    "insales",
+    base_url = INSALES_API_URL,
+    auth     = (INSALES_API_KEY or "", INSALES_API_PWD or ""),
+    timeout  = TIMEOUT,
+)
+
+
+BACKFILL_WORKERS = int(os.getenv("INSALES_BACKFILL_WORKERS", "4"))
+RATE_WINDOW      = 300    # InSales считает запросы в окне 5 минут
+RATE_RETRIES     = 5      # сколько раз ждём после 429/503
+
+
+class _Throttle:
     """
-    Тянем последние `limit` заказов, отдаём список моделей OrderOut.
-    Пытаемся несколько раз прежде чем сдаться.
+    Адаптивная пауза между запросами по заголовку `API-Usage-Limit: used/limit`.
+    Пока израсходовано меньше половины окна — без пауз; дальше остаток
+    запросов равномерно растягивается на окно, чтобы не упереться в 429.
+    Пауза общая для всех параллельных запросов (импорт истории качает
+    в несколько воркеров): они встают в очередь под локом и выходят
+    не чаще, чем раз в `delay` секунд.
     """
-    base = f"https://{INSALES_API_KEY}:{INSALES_API_PWD}@{INSALES_SHOP}/admin"
 
-    last_exc: Exception | None = None
-    for attempt in range(1, RETRIES + 1):
+    def __init__(self) -> None:
+        self.delay = 0.0
+        self._next = 0.0                 # monotonic-время, раньше которого следующий запрос не идёт
+        self._lock = asyncio.Lock()
+
+    def update(self, resp: httpx.Response) -> None:
+        usage = resp.headers.get("API-Usage-Limit")
+        if not usage:
+            return
+        try:
+            used, limit = (int(x) for x in usage.split("/"))
+        except ValueError:
+            return
+        left = max(limit - used, 1)
+        self.delay = 0.0 if used < limit / 2 else RATE_WINDOW / left
+
+    async def wait(self) -> None:
+        async with self._lock:
+            pause = self._next - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self._next = time.monotonic() + self.delay
+
+
+_throttle = _Throttle()
+
+
+def _retry_after(resp: httpx.Response) -> float:
+    try:
+        return float(resp.headers.get("Retry-After", RETRY_PAUSE))
+    except ValueError:
+        return RETRY_PAUSE
+
+
+async def _get(path: str, params: dict | None = None) -> httpx.Response:
+    """
+    GET к API InSales (общий пул соединений): повторы на таймаутах,
+    ожидание по Retry-After на 429/503 и общий троттлинг по лимитам API.
+    """
+    attempt = limited = 0
+    while True:
+        await _throttle.wait()
         try:
-            async with httpx.AsyncClient(base_url=base, timeout=TIMEOUT) as cli:
-                resp = await cli.get(f"/orders.json?per_page={limit}")
-                resp.raise_for_status()
-                data = resp.json()
-            break                                           # успех
-        except (httpx.ConnectTimeout, httpx.ReadTimeout) as e:
-            last_exc = e
+            resp = await http_clients.get("insales").get(path, params=params)
+        except (httpx.ConnectTimeout, httpx.ReadTimeout):
+            attempt += 1
             if attempt < RETRIES:
                 await asyncio.sleep(RETRY_PAUSE)
                 continue
             raise                                            # после N-й попытки – дальше наружу
 
-    # ---- преобразуем в OrderOut, как раньше ----
-    out: list[schemas.OrderOut] = []
-    for it in data:
-        # 1) собираем линии
-        lines = [
-            schemas.OrderLine(
-                product_id    = l["product_id"],
-                product_title = l["title"],
-                quantity      = l["quantity"],
-            )
-            for l in it.get("order_lines", [])
-        ]
-        # 2) парсим дату
-        created = datetime.datetime.fromisoformat(
-            it["created_at"].replace("Z", "+00:00")
-        )
-        # 3) вынимаем кастомный статус (или None)
-        cs = it.get("custom_status")
-
-        out.append(
-            schemas.OrderOut(
-                id               = it["id"],
-                number           = it["number"],
-                customer         = (it.get("client") or {}).get("full_name"),
-                created_at       = created,
-                ignored          = it.get("ignored", False),
-                ready_notified   = False,
-                client_notified  = False,
-                custom_status    = cs,
-                lines            = lines,
-            )
-        )
-    return out
+        _throttle.update(resp)
+        if resp.status_code in (429, 503) and limited < RATE_RETRIES:
+            limited += 1
+            await asyncio.sleep(_retry_after(resp))
+            continue
+        resp.raise_for_status()
+        return resp
+
+
+async def _get_json(path: str, params: dict | None = None):
+    return (await _get(path, params)).json()
+
+
+async def _get_orders(path: str, params: dict | None = None) -> list[schemas.OrderOut]:
+    """Страница заказов: большие ответы декодируем в потоке, не занимая event loop."""
+    raw = (await _get(path, params)).content
+    if len(raw) > DECODE_OFFLOAD_BYTES:
+        return await asyncio.to_thread(decode_orders, raw)
+    return decode_orders(raw)
+
+
+# ---- декодирование заказов ----
+# Ответ InSales валидируется сразу в OrderOut одним проходом pydantic-core
+# по сырым байтам: алиасы переводят поля InSales в наши, лишние поля
+# пропускаются без создания объектов, даты (в т.ч. с «Z») разбираются там же.
+class _InsalesLine(schemas.OrderLine):
+    product_title: str = Field(validation_alias="title")
+
+
+class _InsalesOrder(schemas.OrderOut):
+    customer: Optional[str]      = Field(None, validation_alias=AliasPath("client", "full_name"))
+    lines:    List[_InsalesLine] = Field([], validation_alias="order_lines")
+
+
+_ORDERS = TypeAdapter(List[_InsalesOrder])
+
+
+def decode_orders(raw: bytes) -> list[schemas.OrderOut]:
+    """JSON-массив заказов (сырые байты ответа) → OrderOut, одним проходом."""
+    return _ORDERS.validate_json(raw)
+
+
+def parse_orders(data: list) -> list[schemas.OrderOut]:
+    """То же для уже разобранного JSON (вебхуки)."""
+    return _ORDERS.validate_python(data)
+
+
+async def fetch_orders(limit: int = 50) -> list[schemas.OrderOut]:
+    """
+    Тянем последние `limit` заказов, отдаём список моделей OrderOut.
+    Пытаемся несколько раз прежде чем сдаться.
+    """
+    return await _get_orders(f"/orders.json?per_page={limit}")
+
+
+async def fetch_orders_updated_since(
+    since: datetime.datetime, per_page: int = PER_PAGE
+) -> AsyncIterator[list[schemas.OrderOut]]:
+    """
+    Отдаём все заказы, изменённые начиная с `since` (включительно — последний
+    виденный заказ придёт ещё раз, это безопасно), в порядке updated_at.
+
+    Листаем по ключу, а не page=N: следующий запрос — с updated_since =
+    updated_at последнего заказа. Заказ, изменённый во время обхода, уезжает
+    в конец выборки и приходит позже, а не проскакивает между страницами
+    (иначе водяной знак ушёл бы дальше него и заказ потерялся бы насовсем).
+    Уже отданные заказы с тем же updated_at пропускаем; если вся страница —
+    один момент времени, идём дальше по from_id.
+    """
+    from_id: Optional[int] = None
+    boundary: set = set()             # id заказов с updated_at == since, уже отданные
+    while True:
+        params = {"updated_since": since.isoformat(), "per_page": per_page}
+        if from_id is not None:
+            params["from_id"] = from_id
+        orders = await _get_orders("/orders.json", params=params)
+        fresh = [o for o in orders if not (o.updated_at == since and o.id in boundary)]
+        if fresh:
+            yield fresh
+        if len(orders) < per_page:
+            return
+        last = orders[-1].updated_at
+        if last is None:
+            return                    # без updated_at ключа нет: остаток — в следующем цикле
+        if last == since:
+            from_id = orders[-1].id
+            boundary.update(o.id for o in orders)
+        else:
+            since, from_id = last, None
+            boundary = {o.id for o in orders if o.updated_at == last}
+
+
+async def count_orders() -> int:
+    return int((await _get_json("/orders/count.json"))["count"])
+
+
+async def fetch_all_orders(
+    workers: int = BACKFILL_WORKERS, per_page: int = PER_PAGE
+) -> AsyncIterator[list[schemas.OrderOut]]:
+    """
+    Вся история заказов: страницы качаются параллельно (не больше `workers`
+    запросов одновременно) и отдаются по мере прихода, в любом порядке.
+    Очередь ограничена — если БД не успевает, скачивание ждёт, память не растёт.
+    """
+    pages = -(-await count_orders() // per_page)
+    if not pages:
+        return
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers)
+    numbers = iter(range(1, pages + 1))        # общий для всех воркеров
+
+    async def worker() -> None:
+        for page in numbers:
+            await queue.put(await _get_orders("/orders.json", params={"per_page": per_page, "page": page}))
+
+    async def run() -> None:
+        tasks = [asyncio.create_task(worker()) for _ in range(min(workers, pages))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await queue.put(None)
+
+    runner = asyncio.create_task(run())
+    try:
+        while (page := await queue.get()) is not None:
+            yield page
+        await runner                            # пробрасываем ошибку воркера
+    finally:
+        runner.cancel()
 
 
 async def fetch_order_by_id(order_id: Union[int, str]) -> dict:
-    async with httpx.AsyncClient(base_url=INSALES_API_URL, auth=(INSALES_API_KEY, INSALES_API_PWD)) as cli:
-        resp = await cli.get(f"/orders/{order_id}.json")
-        resp.raise_for_status()
-        payload = resp.json()
+    payload = await _get_json(f"/orders/{order_id}.json")
     return payload.get("order", {})
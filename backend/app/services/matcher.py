@@ -0,0 +1,118 @@
+"""
+Скомпилированный сопоставитель правил списания (Aho-Corasick).
+
+Правило срабатывает, если `pattern.lower()` входит в `product_title.lower()` —
+ровно как в прежнем переборе «строка × правило», но за один проход по названию.
+Автомат строится один раз из таблицы material_rules и кешируется в процессе;
+кеш сбрасывается при изменении правил (crud.create_rule / delete_rule)
+и сверяется с версией правил в checkpoints, чтобы видеть правки других процессов.
+"""
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from backend.app import models
+
+RULES_VERSION = "rules_version"
+
+# (material_id, qty) — что списать по сработавшему правилу
+Hit = Tuple[int, float]
+
+
+class RuleMatcher:
+    """Автомат по набору правил [(pattern, material_id, qty)] в порядке их id."""
+
+    def __init__(self, rules: Iterable[Tuple[str, int, float]]):
+        self.rules: List[Hit] = []
+        self._always: List[int] = []            # пустой шаблон входит в любую строку
+        by_pattern: Dict[str, List[int]] = {}
+        for idx, (pattern, material_id, qty) in enumerate(rules):
+            self.rules.append((material_id, qty))
+            p = pattern.lower()
+            if p:
+                by_pattern.setdefault(p, []).append(idx)
+            else:
+                self._always.append(idx)
+
+        # goto / fail / out: узел 0 — корень
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out:  List[List[int]] = [[]]
+        for p, idxs in by_pattern.items():
+            node = 0
+            for ch in p:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].extend(idxs)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0) if node else 0
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+
+    def match(self, title: str) -> List[Hit]:
+        """Сработавшие правила для названия — в порядке правил, каждое один раз."""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = set(self._always)
+        node = 0
+        for ch in title.lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                hits.update(out[node])
+        return [self.rules[i] for i in sorted(hits)]
+
+
+# ---------------------------------------------------------------------
+# in-process cache
+# ---------------------------------------------------------------------
+_lock = threading.Lock()
+_cache: Optional[Tuple[Optional[str], RuleMatcher]] = None
+
+
+def rules_version(db: Session) -> Optional[str]:
+    cp = db.get(models.Checkpoint, RULES_VERSION)
+    return cp.value if cp else None
+
+
+def get_matcher(db: Session) -> RuleMatcher:
+    """Автомат для текущих правил; пересобирается, только если правила менялись."""
+    global _cache
+    version = rules_version(db)
+    cached = _cache
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        if _cache and _cache[0] == version:
+            return _cache[1]
+        rules = (
+            db.query(models.MaterialRule.pattern,
+                     models.MaterialRule.material_id,
+                     models.MaterialRule.qty)
+            .order_by(models.MaterialRule.id)
+            .all()
+        )
+        matcher = RuleMatcher(rules)
+        _cache = (version, matcher)
+        return matcher
+
+
+def invalidate() -> None:
+    global _cache
+    _cache = None
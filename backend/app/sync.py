@@ -0,0 +1,253 @@
+"""
+Синхронизация с InSales: готовые плёнки, заказы, уведомления, остатки.
+
+Заказы тянутся инкрементально: в checkpoints хранится водяной знак
+`updated_at` последнего обработанного заказа, и каждый цикл запрашивает
+только изменённое с тех пор (все страницы). Знак сдвигается лишь после того,
+как все полученные заказы записаны, — сбой посреди цикла повторит его целиком,
+а повтор безопасен благодаря отпечаткам в upsert_order.
+
+Вся работа с БД идёт через database.run_db (отдельный пул потоков): корутины
+здесь только ждут InSales/Telegram, а запросы к БД не занимают event loop.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from backend.app import crud, models, outbox, resources, schemas, telegram
+from backend.app.database import run_db
+from backend.app.services import insales
+
+logger = logging.getLogger("bg")
+
+# ID «складского» заказа готовых плёнок
+READY_ORDER_ID = 109704738
+
+ORDERS_WATERMARK = "insales_orders_updated_at"
+BOOTSTRAP_LIMIT  = 50      # первый запуск без водяного знака — как раньше, последние 50
+
+
+# ─────── Ready films ───────
+# названия готовых плёнок — индекс в памяти процесса под версией ресурса FILMS
+# (backend/app/resources.py): склад сменился в этом процессе или в другом
+# (NOTIFY, страховка — TTL версии) — индекс перечитывается
+_ready_titles: Optional[Set[str]] = None
+_ready_version: Optional[int] = None
+
+
+def _load_titles(db: Session) -> Set[str]:
+    return {title for (title,) in db.query(models.ReadyFilm.title)}
+
+
+async def ready_titles(db: Session) -> Set[str]:
+    global _ready_titles, _ready_version
+    # версию — до чтения: изменение между ними лишь перечитает индекс ещё раз
+    version = (await resources.validator(resources.FILMS)).version
+    if _ready_titles is None or version != _ready_version:
+        _ready_titles = await run_db(_load_titles, db)
+        _ready_version = version
+    return _ready_titles
+
+
+async def refresh_ready_films(db: Session, ready: Optional[dict] = None) -> Set[str]:
+    """
+    Сверяем склад готовых плёнок со складским заказом (или пришедшим вебхуком),
+    отдаём множество названий.
+    """
+    if ready is None:
+        ready = await insales.fetch_order_by_id(READY_ORDER_ID)
+    if ready:
+        # изменения поднимают версию FILMS — ready_titles перечитает индекс сам
+        await run_db(crud.sync_ready_films, db, ready.get("order_lines", []))
+    return await ready_titles(db)
+
+
+# ─────── Orders ───────
+def _process(db: Session, o: schemas.OrderOut, ready_titles: Set[str]) -> bool:
+    """
+    upsert заказа, затем флаги уведомлений и сообщения в outbox — одним коммитом:
+    флаг без сообщения или сообщение без флага невозможны. upsert_order уже
+    закоммитил и отпустил лок строки, поэтому флаг ставим условным UPDATE
+    (crud.claim_order_flag): из параллельных обработок сообщение ставит одна.
+    """
+    db_order = crud.upsert_order(db, o)
+    queued = False
+
+    # 1) Уведомление о «клиентском» заказе
+    if (o.custom_status
+        and o.custom_status.permalink == "novyy"
+        and not db_order.client_notified
+        and crud.claim_order_flag(db, db_order.id, "client_notified")):
+        logger.info("Пойман клиентский заказ %s, ставим уведомление", o.number)
+        crud.enqueue_message(db, telegram.client_order_text(o.number))
+        queued = True
+
+    # 2) Уведомление о готовой плёнке
+    if not db_order.ready_notified:
+        hits = [ln.product_title for ln in o.lines if ln.product_title in ready_titles]
+        if hits and crud.claim_order_flag(db, db_order.id, "ready_notified"):
+            channel = getattr(o, "source", "неизв.")
+            crud.enqueue_message(db, telegram.film_hit_text(o.number, channel, hits))
+            queued = True
+            logger.info("Уведомление по заказу %s поставлено в outbox", o.number)
+
+    if queued:
+        db.commit()
+    else:
+        db.rollback()       # условный UPDATE мог не найти строку, но транзакцию открыл
+    return queued
+
+
+async def process_order(db: Session, o: schemas.OrderOut, ready_titles: Set[str]) -> None:
+    """upsert заказа + уведомления о клиентском заказе и готовой плёнке (через outbox)."""
+    if str(o.number) == str(READY_ORDER_ID):
+        return
+    if await run_db(_process, db, o, ready_titles):
+        outbox.wakeup.set()
+
+
+def _newest(current: Optional[datetime], o: schemas.OrderOut) -> Optional[datetime]:
+    if o.updated_at and (current is None or o.updated_at > current):
+        return o.updated_at
+    return current
+
+
+def _advance_watermark(db: Session, at: datetime) -> None:
+    crud.set_checkpoint(db, ORDERS_WATERMARK, at.isoformat())
+    db.commit()
+
+
+def _upsert_page(db: Session, page: List[schemas.OrderOut]) -> None:
+    for o in page:
+        if str(o.number) != str(READY_ORDER_ID):
+            crud.upsert_order(db, o)
+
+
+async def sync_orders(db: Session, ready_titles: Set[str]) -> int:
+    """Обрабатываем заказы, изменённые с водяного знака. Возвращаем их число."""
+    stats_before = crud.UPSERT_STATS.copy()
+    raw = await run_db(crud.get_checkpoint, db, ORDERS_WATERMARK)
+
+    seen, newest = 0, None
+    if raw:
+        async for page in insales.fetch_orders_updated_since(datetime.fromisoformat(raw)):
+            for o in page:
+                await process_order(db, o, ready_titles)
+                newest = _newest(newest, o)
+            seen += len(page)
+    else:
+        for o in await insales.fetch_orders(BOOTSTRAP_LIMIT):
+            await process_order(db, o, ready_titles)
+            newest = _newest(newest, o)
+            seen += 1
+
+    # все заказы записаны — только теперь двигаем водяной знак
+    if newest and (not raw or newest > datetime.fromisoformat(raw)):
+        await run_db(_advance_watermark, db, newest)
+
+    cycle = crud.UPSERT_STATS - stats_before
+    logger.info("Заказы: получено %s, новых %s, обновлено %s, без изменений %s",
+                seen, cycle["created"], cycle["rewritten"], cycle["skipped"])
+    return seen
+
+
+async def backfill_orders(db: Session, workers: int = insales.BACKFILL_WORKERS) -> int:
+    """
+    Импорт всей истории заказов (онбординг магазина): страницы качаются
+    параллельно и пишутся по мере прихода. Уведомления не шлём — как и ручной
+    импорт, это загрузка истории. Если инкрементальной синхронизации ещё не было,
+    ставим водяной знак на момент старта, чтобы правки во время импорта не потерялись.
+    """
+    started = datetime.now(timezone.utc)
+    done = 0
+    async for page in insales.fetch_all_orders(workers=workers):
+        await run_db(_upsert_page, db, page)
+        done += len(page)
+        logger.info("Импорт истории: %s заказов", done)
+
+    if not await run_db(crud.get_checkpoint, db, ORDERS_WATERMARK):
+        await run_db(_advance_watermark, db, started)
+    return done
+
+
+# ─────── Webhooks ───────
+WEBHOOK_BATCH = 100
+
+# будит обработчик сразу после приёма вебхука в этом же процессе
+webhook_wakeup = asyncio.Event()
+
+
+def _event_version(ev: models.WebhookEvent) -> tuple:
+    """(updated_at из payload, id события) — для выбора свежей версии заказа."""
+    try:
+        raw = json.loads(ev.payload).get("updated_at") or ""
+        at = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+    except (ValueError, AttributeError, TypeError):
+        at = datetime.min.replace(tzinfo=timezone.utc)
+    return at, ev.id
+
+
+async def consume_webhooks(db: Session) -> int:
+    """
+    Разбираем очередь webhook_events. Несколько событий по одному заказу
+    схлопываем в самое свежее по updated_at; версию старше уже записанной
+    (опрос успел раньше) пропускаем. Обработка идемпотентна (отпечатки
+    в upsert_order, флаги уведомлений), поэтому повтор после сбоя безопасен.
+    Возвращаем число обработанных событий.
+    """
+    events = await run_db(crud.pending_webhooks, db, WEBHOOK_BATCH)
+    if not events:
+        return 0
+
+    # по заказу берём самую свежую версию по updated_at, а не последнюю пришедшую
+    latest: Dict[int, models.WebhookEvent] = {}
+    ids_by_order: Dict[int, List[int]] = {}
+    for ev in events:
+        cur = latest.get(ev.order_id)
+        if cur is None or _event_version(ev) >= _event_version(cur):
+            latest[ev.order_id] = ev
+        ids_by_order.setdefault(ev.order_id, []).append(ev.id)
+
+    for order_id, ev in latest.items():
+        ids = ids_by_order[order_id]
+        try:
+            payload = json.loads(ev.payload)
+            if order_id == READY_ORDER_ID or str(payload.get("number")) == str(READY_ORDER_ID):
+                await refresh_ready_films(db, payload)
+            else:
+                (o,) = insales.parse_orders([payload])
+                if await run_db(crud.is_stale, db, o):
+                    # опрос уже записал версию новее — запоздавший вебхук не применяем
+                    logger.info("Вебхук по заказу %s устарел (updated_at %s), пропускаем",
+                                order_id, o.updated_at)
+                else:
+                    await process_order(db, o, await ready_titles(db))
+        except Exception as exc:
+            await run_db(db.rollback)
+            logger.exception("Вебхук по заказу %s не обработан", order_id)
+            await run_db(crud.finish_webhooks, db, ids, error=repr(exc))
+        else:
+            await run_db(crud.finish_webhooks, db, ids)
+    return len(events)
+
+
+# ─────── Low stock ───────
+async def check_low_stock(db: Session) -> None:
+    flips = await run_db(crud.low_stock_transitions, db)
+    if not flips:
+        return
+    alerts = [f for f in flips if f["alert"]]
+    await run_db(
+        crud.set_alerted,
+        db,
+        alerts,
+        [f["id"] for f in flips if not f["alert"]],
+    )
+    if alerts:
+        outbox.wakeup.set()
@@ -1,15 +1,46 @@
 import os
 import httpx
 import logging
-import asyncio
-from typing import List, Union
+from typing import List, Optional, Union
+
+from backend.app import http_clients
 
 TOKEN       = os.getenv("TG_BOT_TOKEN")
 STOCK_CHAT  = os.getenv("TG_CHAT_ID")                          # общий чат для остатков и пингов
 FILM_CHAT   = os.getenv("TG_FILM_CHAT_ID")      # чат для плёнок
 CLIENT_CHAT = os.getenv("TG_CLIENT_CHAT_ID")    # чат для клиентских заказов
+API_URL     = os.getenv("TG_API_URL", "https://api.telegram.org")   # для стенда — backend.bench.standin
+MAX_TEXT    = 4096                              # предел длины сообщения Telegram
 log         = logging.getLogger("tg")
 
+http_clients.register("telegram", timeout=10)
+
+
+class SendError(Exception):
+    """Telegram не принял сообщение; retry_after — сколько ждать по ответу 429."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+async def deliver(chat_id: str, text: str) -> None:
+    """Отправка с результатом: SendError, если сообщение не принято."""
+    url = f"{API_URL}/bot{TOKEN}/sendMessage"
+    data = {"chat_id": chat_id, "text": text}
+    try:
+        resp = await http_clients.get("telegram").post(url, data=data)
+    except httpx.HTTPError as e:
+        raise SendError(f"{type(e).__name__}: {e}") from e
+    if resp.status_code >= 400:
+        retry_after = None
+        if resp.status_code == 429:
+            try:
+                retry_after = resp.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                pass
+        raise SendError(f"HTTP {resp.status_code}: {resp.text[:200]}", retry_after)
+
 
 async def _post(text: str, chat_id: str):
     if not TOKEN:
@@ -19,16 +50,13 @@ async def _post(text: str, chat_id: str):
         log.warning("chat_id not set; skipping send")
         return
 
-    url = f"https://api.telegram.org/bot{TOKEN}/sendMessage"
-    data = {"chat_id": chat_id, "text": text}
     try:
-        async with httpx.AsyncClient(timeout=10) as cli:
-            await cli.post(url, data=data)
-    except httpx.HTTPError as e:
+        await deliver(chat_id, text)
+    except SendError as e:
         log.error("Telegram send failed: %s", e)
 
 
-async def send(text: str):
+def route(text: str) -> Optional[str]:
     """
     Роутинг по префиксу:
     ✅ — в FILM_CHAT
@@ -36,13 +64,15 @@ async def send(text: str):
     иначе — в STOCK_CHAT
     """
     if text.startswith("✅"):
-        target = FILM_CHAT
-    elif text.startswith("📞"):
-        target = CLIENT_CHAT
-    else:
-        target = STOCK_CHAT
+        return FILM_CHAT
+    if text.startswith("📞"):
+        return CLIENT_CHAT
+    return STOCK_CHAT
+
 
-    await _post(text, target)
+async def send(text: str):
+    """Немедленная отправка мимо outbox (пинги); уведомления — через crud.enqueue_message."""
+    await _post(text, route(text))
 
 
 async def info(msg: str):
@@ -50,16 +80,17 @@ async def info(msg: str):
     await send(f"ℹ️ {msg}")
 
 
-async def low_stock(name: str, q: Union[int, float], m: Union[int, float]):
+# ─────── Тексты уведомлений ───────
+def low_stock_text(name: str, q: Union[int, float], m: Union[int, float]) -> str:
     """⚠️ Уведомление об остатках (в общий чат)."""
-    await send(f"⚠️ Остаток «{name}» достиг минимума ({q} ≤ {m})")
+    return f"⚠️ Остаток «{name}» достиг минимума ({q} ≤ {m})"
 
 
-async def film_hit(order_no: Union[str, int], channel: str, titles: List[str]):
+def film_hit_text(order_no: Union[str, int], channel: str, titles: List[str]) -> str:
     """✅ Уведомление о готовой плёнке (в чат плёнок)."""
-    msg = f"✅ Готовая плёнка в заказе #{order_no} ({channel}): " + ", ".join(titles)
-    await send(msg)
+    return f"✅ Готовая плёнка в заказе #{order_no} ({channel}): " + ", ".join(titles)
 
 
-# при старте шлём «пинг» в общий чат
-asyncio.create_task(info("бот запущен – оповещения готовы"))
+def client_order_text(order_no: Union[str, int]) -> str:
+    """📞 Новый клиентский заказ (в чат клиентских заказов)."""
+    return f"📞 Новый клиентский заказ #{order_no}"
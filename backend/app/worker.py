@@ -0,0 +1,163 @@
+"""
+Фоновые задачи: синхронизация с InSales, вебхуки, остатки, удержание журнала.
+
+Отдельный процесс:
+
+    python -m backend.app.worker
+
+API при этом запускается с APP_MODE=api и несёт только запросы. В режиме
+по умолчанию (APP_MODE=all) те же задачи стартуют внутри веб-процесса, как раньше.
+Каждая задача идёт под выборами лидера (backend.app.leader), так что воркеров
+и веб-процессов может быть сколько угодно — задача крутится в одном.
+
+Расписание:
+    SYNC_INTERVAL        — опрос InSales: заказы и склад готовых плёнок
+                           (900 с при настроенных вебхуках, иначе 60 с)
+    LOW_STOCK_INTERVAL   — проверка минимальных остатков (60 с)
+    WEBHOOK_POLL         — опрос очереди вебхуков, если нас не разбудили (5 с)
+    CLEANUP_INTERVAL     — компакция журнала, чистка очередей вебхуков и outbox (сутки)
+    OUTBOX_POLL          — отправка Telegram outbox, если нас не разбудили (2 с)
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+from backend.app.database import engine, SessionLocal, STOCK_PARTITIONING, run_db
+from backend.app.routes.stats import cutoff_date as stats_cutoff
+from backend.app import crud, http_clients, leader, notify, outbox, partitions, sync, telegram
+
+logger = logging.getLogger("bg")
+
+# с вебхуками опрос InSales — лишь редкая сверка; без них — раз в минуту
+WEBHOOKS_ENABLED   = bool(os.getenv("INSALES_WEBHOOK_TOKEN"))
+SYNC_INTERVAL      = int(os.getenv("SYNC_INTERVAL", "900" if WEBHOOKS_ENABLED else "60"))
+LOW_STOCK_INTERVAL = int(os.getenv("LOW_STOCK_INTERVAL", "60"))
+WEBHOOK_POLL       = float(os.getenv("WEBHOOK_POLL", "5"))
+CLEANUP_INTERVAL   = int(os.getenv("CLEANUP_INTERVAL", str(24 * 3600)))
+WEBHOOK_KEEP       = timedelta(days=7)
+OUTBOX_KEEP        = timedelta(days=7)
+
+
+def cutoff_date() -> datetime:
+    # не меньше года и не позже начала окна /api/stats/totals,
+    # чтобы компакция не меняла статистику за удерживаемый период
+    start = stats_cutoff()
+    return datetime(start.year, start.month, start.day)
+
+
+# ─────── Jobs ───────
+async def fetch_job() -> None:
+    while True:
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            # ——— готовые плёнки ———
+            ready_titles = await sync.refresh_ready_films(db)
+            # ——— заказы, изменённые с прошлого цикла ———
+            await sync.sync_orders(db, ready_titles)
+        except Exception:
+            logger.exception("Синхронизация с InSales упала")
+        finally:
+            await run_db(db.close)
+        await asyncio.sleep(max(0.0, SYNC_INTERVAL - (time.monotonic() - started)))
+
+
+async def low_stock_job() -> None:
+    while True:
+        db = SessionLocal()
+        try:
+            await sync.check_low_stock(db)
+        except Exception:
+            logger.exception("Проверка остатков упала")
+        finally:
+            await run_db(db.close)
+        await asyncio.sleep(LOW_STOCK_INTERVAL)
+
+
+async def webhook_job() -> None:
+    while True:
+        db = SessionLocal()
+        try:
+            # полная пачка — значит, в очереди есть ещё
+            while await sync.consume_webhooks(db) >= sync.WEBHOOK_BATCH:
+                pass
+        except Exception:
+            logger.exception("Обработчик вебхуков упал")
+        finally:
+            await run_db(db.close)
+
+        # в отдельном воркере вебхук принимает веб-процесс — будит только опрос
+        try:
+            await asyncio.wait_for(sync.webhook_wakeup.wait(), WEBHOOK_POLL)
+        except asyncio.TimeoutError:
+            pass
+        sync.webhook_wakeup.clear()
+
+
+def cleanup_once() -> None:
+    with SessionLocal() as db:
+        if STOCK_PARTITIONING:
+            # секции на будущее + удаление целых просроченных месяцев
+            with engine.begin() as conn:
+                partitions.ensure_partitions(conn)
+            partitions.drop_expired(db, cutoff_date())
+        n = crud.compact_movements(db, cutoff_date())
+        if n:
+            logger.info("Компакция журнала: свёрнуто %s движений", n)
+        crud.purge_webhooks(db, datetime.utcnow() - WEBHOOK_KEEP)
+        crud.purge_outbox(db, datetime.utcnow() - OUTBOX_KEEP)
+
+
+async def cleanup_job() -> None:
+    while True:
+        try:
+            # целиком в пуле БД: компакция за год идёт минутами
+            await run_db(cleanup_once)
+        except Exception:
+            logger.exception("Компакция журнала упала")
+        await asyncio.sleep(CLEANUP_INTERVAL)
+
+
+JOBS: Dict[str, Callable[[], Awaitable[None]]] = {
+    "fetch":     fetch_job,
+    "low_stock": low_stock_job,
+    "webhooks":  webhook_job,
+    "cleanup":   cleanup_job,
+    "outbox":    outbox.sender_job,
+}
+
+
+def start_jobs() -> List[asyncio.Task]:
+    """Все задачи — каждая под своим локом лидера."""
+    return [asyncio.create_task(leader.run_as_leader(name, job)) for name, job in JOBS.items()]
+
+
+# ─────── Entry point ───────
+async def main() -> None:
+    await http_clients.startup()
+    # версии ресурсов (индекс готовых плёнок) и кеши меняются и в веб-процессах
+    notify.start()
+    tasks = start_jobs()
+    await telegram.info("воркер запущен – оповещения готовы")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Воркер останавливается")
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    notify.stop()
+    await http_clients.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Микробенчмарк декодирования страницы заказов InSales.
+
+Сравнивает прежний путь (resp.json() + OrderLine/OrderOut через keyword-конструктор
+с полной валидацией и fromisoformat на каждую дату) с insales.decode_orders.
+
+    python -m backend.bench.decode                    # синтетическая страница
+    python -m backend.bench.decode orders.json [N]    # записанный ответ /orders.json
+"""
+import datetime
+import json
+import random
+import sys
+import time
+
+from backend.app import schemas
+from backend.app.services.insales import decode_orders
+
+
+def synthetic_page(n: int = 100, lines: int = 4) -> bytes:
+    rnd = random.Random(1)
+    orders = []
+    for i in range(n):
+        orders.append({
+            "id": 100000 + i,
+            "number": 5000 + i,
+            "created_at": "2025-06-17T12:34:56.000+03:00",
+            "updated_at": "2025-06-17T13:00:00.000+03:00",
+            "client": {"full_name": f"Клиент {i}", "email": "x@example.com", "phone": "+7"},
+            "custom_status": {"permalink": "novyy", "title": "Новый", "system_status": "new"},
+            "shipping_address": {"address": "ул. Ленина, 1", "city": "Москва"},
+            "comment": "x" * 200,
+            "order_lines": [
+                {
+                    "id": i * 10 + j,
+                    "product_id": rnd.randint(1, 10 ** 6),
+                    "title": f"Плёнка гидрогелевая iPhone {rnd.randint(7, 16)} Pro",
+                    "quantity": rnd.randint(1, 3),
+                    "sale_price": "990.0",
+                    "sku": f"SKU-{j}",
+                    "weight": None,
+                }
+                for j in range(lines)
+            ],
+        })
+    return json.dumps(orders, ensure_ascii=False).encode()
+
+
+def legacy_decode(raw: bytes) -> list:
+    out = []
+    for it in json.loads(raw):
+        lines = [
+            schemas.OrderLine(
+                product_id    = l["product_id"],
+                product_title = l["title"],
+                quantity      = l["quantity"],
+            )
+            for l in it.get("order_lines", [])
+        ]
+        created = datetime.datetime.fromisoformat(it["created_at"].replace("Z", "+00:00"))
+        out.append(schemas.OrderOut(
+            id              = it["id"],
+            number          = it["number"],
+            customer        = (it.get("client") or {}).get("full_name"),
+            created_at      = created,
+            ignored         = it.get("ignored", False),
+            ready_notified  = False,
+            client_notified = False,
+            custom_status   = it.get("custom_status"),
+            lines           = lines,
+        ))
+    return out
+
+
+def _bench(fn, raw: bytes, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn(raw)
+    return (time.perf_counter() - t0) / rounds
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            raw = f.read()
+    else:
+        raw = synthetic_page()
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    old, new = legacy_decode(raw), decode_orders(raw)
+    assert [(o.id, o.number, o.customer, o.created_at, [l.model_dump() for l in o.lines]) for o in old] == \
+           [(o.id, o.number, o.customer, o.created_at, [l.model_dump() for l in o.lines]) for o in new], \
+           "новый декодер дал другие заказы"
+
+    t_old = _bench(legacy_decode, raw, rounds)
+    t_new = _bench(decode_orders, raw, rounds)
+    print(f"payload {len(raw) / 1024:.0f} KiB, {len(new)} orders, {rounds} rounds")
+    print(f"legacy  {t_old * 1000:8.2f} ms/page")
+    print(f"decode  {t_new * 1000:8.2f} ms/page  x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
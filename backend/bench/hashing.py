@@ -0,0 +1,87 @@
+"""
+Хеширование паролей: хешей в секунду и p99 входа под параллельной нагрузкой.
+
+    python -m backend.bench.hashing                       # только пул bcrypt, в процессе
+    python -m backend.bench.hashing http://127.0.0.1:8000 <user> <password> [входов] [параллельно]
+
+Без URL — хешей/с через hashing.hash_password при BCRYPT_ROUNDS/HASH_WORKERS
+из окружения и задержка «постороннего» вызова в общем threadpool, пока идут хеши.
+С URL — параллельные POST /auth/login и одновременно GET /api/health: p50/p99 обоих.
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from backend.app import hashing
+
+
+def _pct(lat: list, q: float) -> float:
+    lat = sorted(lat)
+    return lat[min(len(lat) - 1, int(len(lat) * q))] * 1000
+
+
+async def _probe(stop: asyncio.Event, call) -> list:
+    lat = []
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await call()
+        lat.append(time.perf_counter() - t0)
+        await asyncio.sleep(0.01)
+    return lat
+
+
+async def local(n: int = 64, concurrency: int = 16) -> None:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(stop, lambda: run_in_threadpool(lambda: None)))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with sem:
+            await hashing.hash_password("correct horse battery staple")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    lat = await probe
+    print(f"rounds {hashing.BCRYPT_ROUNDS}, workers {hashing.HASH_WORKERS}: "
+          f"{n / elapsed:6.1f} hashes/s")
+    print(f"threadpool probe during hashing: p50 {_pct(lat, .5):6.2f} ms  p99 {_pct(lat, .99):6.2f} ms")
+
+
+async def remote(base: str, user: str, password: str, n: int, concurrency: int) -> None:
+    async with httpx.AsyncClient(base_url=base, timeout=120) as cli:
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(stop, lambda: cli.get("/api/health")))
+        sem = asyncio.Semaphore(concurrency)
+        lat, codes = [], []
+
+        async def one() -> None:
+            async with sem:
+                t0 = time.perf_counter()
+                r = await cli.post("/auth/login", data={"username": user, "password": password})
+                lat.append(time.perf_counter() - t0)
+                codes.append(r.status_code)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        health = await probe
+
+    print(f"{n} logins, {concurrency} concurrent: {n / elapsed:6.1f} logins/s, "
+          f"200: {codes.count(200)}, 503: {codes.count(503)}")
+    print(f"login  p50 {_pct(lat, .5):8.1f} ms  p99 {_pct(lat, .99):8.1f} ms")
+    print(f"health p50 {_pct(health, .5):8.1f} ms  p99 {_pct(health, .99):8.1f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        asyncio.run(remote(sys.argv[1], sys.argv[2], sys.argv[3],
+                           int(sys.argv[4]) if len(sys.argv) > 4 else 200,
+                           int(sys.argv[5]) if len(sys.argv) > 5 else 50))
+    else:
+        asyncio.run(local())
@@ -0,0 +1,69 @@
+"""
+p50/p99 задержки /api/health, пока в том же event loop идёт большая синхронизация.
+
+Нужны стенд (backend.bench.standin с несколькими тысячами заказов) и тестовая БД,
+переменные окружения — как для backend.bench.sync:
+
+    python -m backend.bench.health            # БД через run_db (как в приложении)
+    python -m backend.bench.health --inline   # БД прямо в event loop (прежнее поведение)
+
+Пробник — тот же обработчик health, что в main, в приложении без статики и фоновых
+циклов; запросы идут через ASGI-транспорт, так что задержка — это ровно простой loop.
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from backend.app import http_clients, sync
+from backend.app.database import SessionLocal
+
+PROBE_INTERVAL = 0.01
+
+
+def probe_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/health")
+    def health():
+        return {"status": "ok"}
+
+    return app
+
+
+async def _inline(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+async def main() -> None:
+    if "--inline" in sys.argv:
+        sync.run_db = _inline
+
+    await http_clients.startup()
+    lat = []
+    db = SessionLocal()
+    try:
+        job = asyncio.create_task(sync.backfill_orders(db))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=probe_app()),
+                                     base_url="http://probe") as cli:
+            while not job.done():
+                t0 = time.perf_counter()
+                await cli.get("/api/health")
+                lat.append(time.perf_counter() - t0)
+                await asyncio.sleep(PROBE_INTERVAL)
+        n = await job
+    finally:
+        db.close()
+        await http_clients.shutdown()
+
+    lat.sort()
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+    print(f"synced {n} orders, {len(lat)} health probes")
+    print(f"p50 {statistics.median(lat) * 1000:8.2f} ms   p99 {p99 * 1000:8.2f} ms   max {lat[-1] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
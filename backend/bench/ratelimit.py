@@ -0,0 +1,152 @@
+"""
+Накладные расходы rate-limit на одну проверку.
+
+    python -m backend.bench.ratelimit [проверок] [потоков] [ключей]
+    python -m backend.bench.ratelimit health [запросов] [параллельно] [пользователей]
+
+Гоняет FixedWindowRateLimiter.hit по памяти процесса (memory://) и — если
+задан DATABASE_URL с PostgreSQL — по общей таблице (pg://, нужна миграция 0007).
+Потоки изображают параллельные запросы/процессы, ключи — разных пользователей.
+Печатает мкс на проверку (p50/p99) и проверок в секунду; отдельно — разбор
+JWT в ключевой функции user_or_ip.
+
+health — приложение в процессе (httpx.ASGITransport) с limiter из RATELIMIT_STORAGE:
+параллельные запросы к маршруту под DEFAULT_LIMIT (большая часть — 429)
+и одновременно GET /api/health. Хранилище, которое блокирует event loop,
+видно по p99 health.
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from fastapi import FastAPI
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+from slowapi import _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.middleware import SlowAPIMiddleware
+from starlette.requests import Request
+
+from backend.app import ratelimit
+from backend.app.ratelimit import RATELIMIT_STORAGE, limiter, user_or_ip  # заодно регистрирует pg://
+from backend.app.security import create_access_token
+
+
+def _pct(lat: list, q: float) -> float:
+    lat = sorted(lat)
+    return lat[min(len(lat) - 1, int(len(lat) * q))] * 1e6
+
+
+def run(uri: str, n: int, threads: int, keys: int) -> None:
+    storage = storage_from_string(uri)
+    if not storage.check():
+        print(f"{uri:10} недоступно, пропускаем")
+        return
+    storage.reset()
+    limiter = FixedWindowRateLimiter(storage)
+    item = parse("1000000/minute")
+
+    def worker(t: int) -> list:
+        lat = []
+        for i in range(n // threads):
+            t0 = time.perf_counter()
+            limiter.hit(item, "bench", f"user:{(t * 7919 + i) % keys}")
+            lat.append(time.perf_counter() - t0)
+        return lat
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        lat = [x for part in pool.map(worker, range(threads)) for x in part]
+    elapsed = time.perf_counter() - t0
+    storage.reset()
+    print(f"{uri:10} {threads:3} потоков: p50 {_pct(lat, .5):8.1f} мкс  "
+          f"p99 {_pct(lat, .99):8.1f} мкс  {len(lat) / elapsed:9.0f} проверок/с")
+
+
+def key_func(n: int) -> None:
+    token = create_access_token("collector")
+    scope = {"type": "http", "client": ("10.0.0.1", 1234),
+             "headers": [(b"authorization", f"Bearer {token}".encode())]}
+    request = Request(scope)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        user_or_ip(request)
+    print(f"user_or_ip (JWT): {(time.perf_counter() - t0) / n * 1e6:8.1f} мкс")
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_middleware(SlowAPIMiddleware)
+
+    @app.get("/api/health")
+    @limiter.exempt
+    def health():
+        return {"status": "ok"}
+
+    @app.get("/api/limited")
+    async def limited():
+        return {}
+
+    return app
+
+
+async def _probe(stop: asyncio.Event, call) -> list:
+    lat = []
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await call()
+        lat.append(time.perf_counter() - t0)
+        await asyncio.sleep(0.01)
+    return lat
+
+
+async def health(n: int, concurrency: int, users: int) -> None:
+    ratelimit.start()
+    tokens = [create_access_token(f"bench{i}") for i in range(users)]
+    transport = httpx.ASGITransport(app=_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as cli:
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(stop, lambda: cli.get("/api/health")))
+        sem = asyncio.Semaphore(concurrency)
+        codes = []
+
+        async def one(i: int) -> None:
+            async with sem:
+                r = await cli.get("/api/limited",
+                                  headers={"Authorization": f"Bearer {tokens[i % users]}"})
+                codes.append(r.status_code)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        lat = await probe
+    await ratelimit.stop()
+    print(f"{RATELIMIT_STORAGE} {n} запросов, {concurrency} параллельно: {n / elapsed:7.0f} запросов/с, "
+          f"200: {codes.count(200)}, 429: {codes.count(429)}")
+    print(f"health p50 {_pct(lat, .5) / 1000:6.2f} мс  p99 {_pct(lat, .99) / 1000:6.2f} мс")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "health":
+        asyncio.run(health(int(sys.argv[2]) if len(sys.argv) > 2 else 5000,
+                           int(sys.argv[3]) if len(sys.argv) > 3 else 50,
+                           int(sys.argv[4]) if len(sys.argv) > 4 else 10))
+        sys.exit()
+
+    n       = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    keys    = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    key_func(n)
+    run("memory://", n, 1, keys)
+    run("memory://", n, threads, keys)
+    if os.getenv("DATABASE_URL", "").startswith("postgresql"):
+        run("pg://", n, 1, keys)
+        run("pg://", n, threads, keys)
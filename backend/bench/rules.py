@@ -0,0 +1,64 @@
+"""
+Бенчмарк сопоставления правил: прежний перебор «строка × правило» против автомата.
+
+    python -m backend.bench.rules [правил] [строк]
+"""
+import random
+import sys
+import time
+
+from backend.app.services.matcher import RuleMatcher
+
+WORDS = ("плёнка", "матовая", "глянцевая", "iphone", "samsung", "xiaomi", "pro",
+         "max", "mini", "ultra", "чехол", "стекло", "гидрогель", "задняя", "камера")
+
+
+def _naive(rules, titles):
+    out = []
+    for title in titles:
+        title_lc = title.lower()
+        for pattern, material_id, qty in rules:
+            if pattern.lower() in title_lc:
+                out.append((material_id, qty))
+    return out
+
+
+def _compiled(m, titles):
+    out = []
+    for title in titles:
+        out.extend(m.match(title))
+    return out
+
+
+def main(n_rules: int = 5000, n_lines: int = 2000) -> None:
+    rnd = random.Random(42)
+    rules = [
+        (" ".join(rnd.sample(WORDS, rnd.randint(1, 2))) + f" {i}", rnd.randint(1, 50), 1.0)
+        for i in range(n_rules)
+    ]
+    titles = [
+        " ".join(rnd.sample(WORDS, 4)) + f" {rnd.randint(0, n_rules)}"
+        for _ in range(n_lines)
+    ]
+
+    t0 = time.perf_counter()
+    m = RuleMatcher(rules)
+    build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    expected = _naive(rules, titles)
+    naive = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    got = _compiled(m, titles)
+    compiled = time.perf_counter() - t0
+
+    assert got == expected, "автомат дал другие движения"
+    print(f"rules={n_rules} lines={n_lines} hits={len(got)}")
+    print(f"build    {build * 1000:9.1f} ms (один раз на версию правил)")
+    print(f"naive    {naive * 1000:9.1f} ms")
+    print(f"compiled {compiled * 1000:9.1f} ms  x{naive / compiled:.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,241 @@
+"""
+Локальная замена InSales и Telegram Bot API для нагрузочных прогонов.
+
+Отдаёт записанные или синтетические заказы так же, как InSales
+(/admin/orders.json с per_page/page/updated_since/from_id, /admin/orders/count.json,
+/admin/orders/{id}.json), и принимает /bot<token>/sendMessage как Telegram.
+Задержка, доля ошибок, лимит запросов (заголовок API-Usage-Limit, 429) — настраиваются.
+
+    python -m backend.bench.standin --orders 20000 --latency 80 --error-rate 0.01
+
+Приложение переключается конфигурацией:
+    INSALES_API_URL=http://127.0.0.1:8900/admin
+    TG_API_URL=http://127.0.0.1:8900
+    TG_BOT_TOKEN=standin TG_CHAT_ID=1 TG_FILM_CHAT_ID=2 TG_CLIENT_CHAT_ID=3
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# как sync.READY_ORDER_ID; стенд не тянет за собой приложение (БД, бота)
+READY_ORDER_ID = 109704738
+
+TITLES = ("Плёнка гидрогелевая", "Стекло защитное", "Плёнка матовая", "Чехол силиконовый")
+MODELS = ("iPhone 13", "iPhone 14 Pro", "iPhone 15", "Galaxy S23", "Redmi Note 12", "Pixel 8")
+STATUSES = (("novyy", "Новый"), ("v-rabote", "В работе"), ("gotov", "Готов"))
+
+
+# ---------------------------------------------------------------------
+# data
+# ---------------------------------------------------------------------
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(timespec="milliseconds")
+
+
+def synthetic_orders(n: int, lines: int = 3, seed: int = 1) -> List[dict]:
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    orders = []
+    for i in range(n):
+        created = now - timedelta(minutes=(n - i) * 7)
+        permalink, title = rnd.choice(STATUSES)
+        orders.append({
+            "id": 1_000_000 + i,
+            "number": 10_000 + i,
+            "created_at": _iso(created),
+            "updated_at": _iso(created + timedelta(minutes=rnd.randint(0, 60))),
+            "client": {"full_name": f"Клиент {i}", "email": f"c{i}@example.com"},
+            "custom_status": {"permalink": permalink, "title": title},
+            "comment": "",
+            "order_lines": [
+                {
+                    "id": i * 100 + j,
+                    "product_id": rnd.randint(1, 5000),
+                    "title": f"{rnd.choice(TITLES)} {rnd.choice(MODELS)}",
+                    "sku": f"SKU-{rnd.randint(1, 5000)}",
+                    "quantity": rnd.randint(1, 3),
+                    "sale_price": "990.0",
+                }
+                for j in range(rnd.randint(1, lines))
+            ],
+        })
+    return orders
+
+
+def ready_order(seed: int = 2) -> dict:
+    rnd = random.Random(seed)
+    return {
+        "id": READY_ORDER_ID,
+        "number": READY_ORDER_ID,
+        "created_at": _iso(datetime.now(timezone.utc)),
+        "updated_at": _iso(datetime.now(timezone.utc)),
+        "order_lines": [
+            {"id": j, "product_id": j, "sku": f"READY-{j}",
+             "title": f"{t} {m}", "quantity": rnd.randint(1, 5)}
+            for j, (t, m) in enumerate((t, m) for t in TITLES[:2] for m in MODELS)
+        ],
+    }
+
+
+# ---------------------------------------------------------------------
+# server
+# ---------------------------------------------------------------------
+class Standin:
+    def __init__(self, orders: List[dict], latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, rate_limit: int = 0, rate_window: float = 300,
+                 tg_per_chat: int = 0):
+        self.orders      = sorted(orders, key=lambda o: o["id"], reverse=True)
+        self.by_id       = {o["id"]: o for o in self.orders}
+        self.by_id[READY_ORDER_ID] = self.by_id.get(READY_ORDER_ID) or ready_order()
+        self.latency     = latency_ms / 1000
+        self.jitter      = jitter_ms / 1000
+        self.error_rate  = error_rate
+        self.rate_limit  = rate_limit
+        self.rate_window = rate_window
+        self.tg_per_chat = tg_per_chat          # сообщений в минуту на чат (0 — без лимита)
+        self.calls: deque = deque()
+        self.tg_calls: Dict[str, deque] = defaultdict(deque)
+        self.stats: Counter = Counter()
+        self.messages: List[dict] = []
+
+    async def delay(self) -> None:
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def _usage(self) -> tuple:
+        now = time.monotonic()
+        while self.calls and now - self.calls[0] > self.rate_window:
+            self.calls.popleft()
+        self.calls.append(now)
+        return len(self.calls), self.rate_limit
+
+    def insales(self, payload) -> Response:
+        """Общая обёртка ответа InSales: ошибки, лимит, заголовок API-Usage-Limit."""
+        used, limit = self._usage()
+        headers = {"API-Usage-Limit": f"{used}/{limit}"} if limit else {}
+        if limit and used > limit:
+            self.stats["insales_429"] += 1
+            return JSONResponse({"error": "rate limit"}, 429, {**headers, "Retry-After": "5"})
+        if self.error_rate and random.random() < self.error_rate:
+            self.stats["insales_503"] += 1
+            return JSONResponse({"error": "injected"}, 503, headers)
+        self.stats["insales_ok"] += 1
+        return Response(json.dumps(payload, ensure_ascii=False), 200, headers,
+                        media_type="application/json")
+
+    def mutate(self, n: int) -> List[int]:
+        """Имитируем правки в магазине: меняем количество и updated_at у n заказов."""
+        now = _iso(datetime.now(timezone.utc))
+        touched = random.sample(self.orders, min(n, len(self.orders)))
+        for o in touched:
+            if o["order_lines"]:
+                o["order_lines"][0]["quantity"] += 1
+            o["updated_at"] = now
+        return [o["id"] for o in touched]
+
+    def app(self) -> FastAPI:
+        app = FastAPI(title="InSales/Telegram stand-in")
+
+        @app.get("/admin/orders.json")
+        async def orders(per_page: int = 10, page: int = 1, updated_since: Optional[str] = None,
+                         from_id: Optional[int] = None):
+            await self.delay()
+            items = self.orders
+            if updated_since:
+                # по (updated_at, id); from_id — продолжение внутри одного updated_at
+                since = datetime.fromisoformat(updated_since.replace("Z", "+00:00"))
+                key = lambda o: (datetime.fromisoformat(o["updated_at"]), o["id"])
+                items = sorted(
+                    (o for o in items
+                     if key(o) >= (since, -1 if from_id is None else from_id + 1)),
+                    key=key,
+                )
+            start = (page - 1) * per_page
+            return self.insales(items[start:start + per_page])
+
+        @app.get("/admin/orders/count.json")
+        async def count():
+            await self.delay()
+            return self.insales({"count": len(self.orders)})
+
+        @app.get("/admin/orders/{order_id}.json")
+        async def order(order_id: int):
+            await self.delay()
+            o = self.by_id.get(order_id)
+            if o is None:
+                return JSONResponse({"error": "not found"}, 404)
+            return self.insales({"order": o})
+
+        @app.post("/bot{token}/sendMessage")
+        async def send_message(token: str, request: Request):
+            await self.delay()
+            form = dict(await request.form())
+            chat = str(form.get("chat_id"))
+            if self.tg_per_chat:
+                now, calls = time.monotonic(), self.tg_calls[chat]
+                while calls and now - calls[0] > 60:
+                    calls.popleft()
+                if len(calls) >= self.tg_per_chat:
+                    self.stats["tg_429"] += 1
+                    retry = int(60 - (now - calls[0])) + 1
+                    return JSONResponse({"ok": False, "error_code": 429,
+                                         "parameters": {"retry_after": retry}}, 429)
+                calls.append(now)
+            if self.error_rate and random.random() < self.error_rate:
+                self.stats["tg_502"] += 1
+                return JSONResponse({"ok": False, "error_code": 502}, 502)
+            self.stats["tg_ok"] += 1
+            self.messages.append({"chat_id": chat, "text": form.get("text"), "at": time.time()})
+            return {"ok": True, "result": {"message_id": len(self.messages), "chat": {"id": chat}}}
+
+        @app.get("/_standin/stats")
+        async def stats():
+            return {"orders": len(self.orders), "calls": dict(self.stats),
+                    "messages": len(self.messages), "last_messages": self.messages[-10:]}
+
+        @app.post("/_standin/mutate")
+        async def mutate(n: int = 10):
+            return {"touched": self.mutate(n)}
+
+        return app
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--orders", type=int, default=5000, help="синтетических заказов")
+    ap.add_argument("--record", help="JSON-файл с записанными заказами (массив или страницы /orders.json)")
+    ap.add_argument("--latency", type=float, default=0, help="средняя задержка ответа, мс")
+    ap.add_argument("--jitter", type=float, default=0, help="разброс задержки, мс")
+    ap.add_argument("--error-rate", type=float, default=0, help="доля ответов 503/502")
+    ap.add_argument("--rate-limit", type=int, default=0, help="запросов InSales на окно (0 — без лимита)")
+    ap.add_argument("--rate-window", type=float, default=300, help="окно лимита, с")
+    ap.add_argument("--tg-per-chat", type=int, default=0, help="сообщений Telegram в минуту на чат")
+    args = ap.parse_args()
+
+    if args.record:
+        with open(args.record, encoding="utf-8") as f:
+            data = json.load(f)
+        # допускаем и массив заказов, и массив страниц
+        orders = [o for page in data for o in page] if data and isinstance(data[0], list) else data
+    else:
+        orders = synthetic_orders(args.orders)
+
+    server = Standin(orders, args.latency, args.jitter, args.error_rate,
+                     args.rate_limit, args.rate_window, args.tg_per_chat)
+
+    import uvicorn
+    uvicorn.run(server.app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Пропускная способность синхронизации против стенда backend.bench.standin.
+
+Запуск (стенд уже поднят, переменные окружения указывают на него, БД — тестовая):
+
+    INSALES_API_URL=http://127.0.0.1:8900/admin TG_API_URL=http://127.0.0.1:8900 \\
+    TG_BOT_TOKEN=standin TG_CHAT_ID=1 TG_FILM_CHAT_ID=2 TG_CLIENT_CHAT_ID=3 \\
+    DATABASE_URL=postgresql+psycopg2://… python -m backend.bench.sync [правок_на_цикл] [циклов]
+
+Сначала импорт всей истории (backfill_orders), затем циклы: стенд правит N заказов,
+sync_orders забирает их по водяному знаку. Печатает заказы/с и сколько сообщений
+получил «Telegram».
+"""
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+from backend.app import crud, http_clients, sync
+from backend.app.database import SessionLocal
+
+STANDIN = os.getenv("TG_API_URL", "http://127.0.0.1:8900")
+
+
+async def main() -> None:
+    edits  = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    await http_clients.startup()
+    db = SessionLocal()
+    try:
+        async with httpx.AsyncClient(base_url=STANDIN) as ctl:
+            t0 = time.perf_counter()
+            total = await sync.backfill_orders(db)
+            dt = time.perf_counter() - t0
+            print(f"backfill   {total:7d} orders  {dt:7.2f} s  {total / dt:8.0f} orders/s")
+
+            titles = await sync.refresh_ready_films(db)
+            for i in range(cycles):
+                await ctl.post("/_standin/mutate", params={"n": edits})
+                before = crud.UPSERT_STATS.copy()
+                t0 = time.perf_counter()
+                seen = await sync.sync_orders(db, titles)
+                dt = time.perf_counter() - t0
+                cycle = crud.UPSERT_STATS - before
+                print(f"cycle {i + 1:3d}  {seen:7d} orders  {dt:7.2f} s  "
+                      f"rewritten {cycle['rewritten']}, skipped {cycle['skipped']}")
+
+            stats = (await ctl.get("/_standin/stats")).json()
+            print("standin", stats["calls"], "messages", stats["messages"])
+            print("http", http_clients.stats())
+    finally:
+        db.close()
+        await http_clients.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
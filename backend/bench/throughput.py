@@ -0,0 +1,63 @@
+"""
+Пропускная способность обработчиков при параллельных запросах сборщиков.
+
+Поднимите приложение дважды — с DB_ASYNC=0 (Session в пуле потоков) и DB_ASYNC=1
+(AsyncSession на asyncpg) — и прогоните против каждого. Оба раза — с
+RATELIMIT_ENABLED=0: бенч ходит одним пользователем, и READ_LIMIT (600/minute)
+иначе превратит большую часть запросов в 429; получив 429, бенч останавливается.
+
+    python -m backend.bench.throughput http://127.0.0.1:8000 <user> <password> [запросов] [параллельно]
+
+Бьёт по /api/materials/stock и /api/films/ (то, что опрашивает collector.html),
+печатает запросов/с и p50/p99.
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+PATHS = ("/api/materials/stock", "/api/films/")
+
+
+async def main() -> None:
+    base, user, password = sys.argv[1:4]
+    total       = int(sys.argv[4]) if len(sys.argv) > 4 else 2000
+    concurrency = int(sys.argv[5]) if len(sys.argv) > 5 else 100
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as cli:
+        r = await cli.post("/auth/login", data={"username": user, "password": password})
+        r.raise_for_status()
+        cli.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+
+        lat, errors, limited = [], 0, False
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(PATHS[i % len(PATHS)])
+
+        async def worker() -> None:
+            nonlocal errors, limited
+            while not queue.empty() and not limited:
+                path = queue.get_nowait()
+                t0 = time.perf_counter()
+                resp = await cli.get(path)
+                lat.append(time.perf_counter() - t0)
+                limited |= resp.status_code == 429
+                errors += resp.status_code != 200
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    if limited:
+        sys.exit("429 Too Many Requests: запустите приложение с RATELIMIT_ENABLED=0")
+    lat.sort()
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+    print(f"{total} requests, {concurrency} concurrent, {errors} errors")
+    print(f"{total / elapsed:8.0f} req/s   p50 {statistics.median(lat) * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
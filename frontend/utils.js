@@ -1,5 +1,9 @@
 /* utils.js — общие помощники фронта */
 
+/* условные GET: ETag последнего ответа по URL и его тело.
+   Сервер отвечает 304, если данные не менялись, — отдаём сохранённое. */
+const validators = new Map();   // url → { etag, body, type }
+
 export async function api(path, opts = {}) {
   const token = localStorage.getItem('token');
   const headers = opts.headers ? { ...opts.headers } : {};
@@ -8,13 +12,32 @@ export async function api(path, opts = {}) {
   // если запрошен /auth/…, не добавляем /api
   const url = path.startsWith('/auth') ? path : '/api' + path;
 
-  const res = await fetch(url, { ...opts, headers });
+  const isGet  = (opts.method || 'GET').toUpperCase() === 'GET';
+  const cached = isGet ? validators.get(url) : null;
+  if (cached) headers['If-None-Match'] = cached.etag;
+
+  // no-store: 304 приходит к нам, а не подменяется кешем браузера
+  const res = await fetch(url, { ...(isGet ? { cache: 'no-store' } : {}), ...opts, headers });
   if (res.status === 401) {
     // не авторизованы
     localStorage.removeItem('token');
     window.location = '/login.html';
     return;
   }
+  if (res.status === 304 && cached) {
+    return new Response(cached.body, {
+      status: 200,
+      headers: { 'Content-Type': cached.type, 'ETag': cached.etag }
+    });
+  }
+  const etag = res.headers.get('ETag');
+  if (isGet && res.ok && etag) {
+    validators.set(url, {
+      etag,
+      body: await res.clone().text(),
+      type: res.headers.get('Content-Type') || 'application/json'
+    });
+  }
   return res;
 }
 